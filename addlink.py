@@ -7,6 +7,9 @@ Pot funcionar com a CLI, API standalone o ser importat per altres aplicacions
 import sqlite3
 from sqlite3 import Error
 from datetime import datetime
+import io
+import os
+import socket
 from os import path
 import sys
 import logging
@@ -14,6 +17,74 @@ import argparse
 import importlib.util
 from typing import Optional, Tuple
 from flask import Flask, request, render_template, jsonify
+from werkzeug.serving import make_server, WSGIRequestHandler
+import dbtools
+import queue
+from dbtools import get_pool, get_writer, add_links_bulk, validate_link, ON_CONFLICT_POLICIES, DuplicateLinkError, TypeCache
+from staticsite import rebuild_after_write
+from icons import localize_icons
+import templating
+
+# Cos més gran que es llegeix a memòria per mantenir la connexió oberta
+MAX_KEEPALIVE_BODY = 16 * 1024 * 1024
+
+class KeepAliveRequestHandler(WSGIRequestHandler):
+    """
+    Manté oberta la connexió entre peticions (HTTP/1.1) perquè el client
+    (AddLinkService) la reutilitzi. werkzeug envia sempre Connection: close
+    i, en acabar, buida el que quedi al socket, cosa que es menjaria la
+    petició següent. Aquí el cos es llegeix sencer abans de cridar
+    l'aplicació i el buidatge de werkzeug llegeix d'un buffer buit. Les
+    peticions chunked, amb Expect o amb un cos massa gran tanquen la
+    connexió com abans. Una connexió inactiva es tanca al cap de timeout
+    segons i el client en torna a obrir una.
+    """
+    protocol_version = 'HTTP/1.1'
+    timeout = 60
+    keep_alive = False
+
+    def setup(self):
+        super().setup()
+        # Capçaleres i cos van en escriptures separades: sense TCP_NODELAY, en
+        # una connexió oberta el cos espera l'ACK retardat del client (~40 ms)
+        if self.connection.family in (socket.AF_INET, socket.AF_INET6):
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def _read_body(self):
+        """Cos de la petició, o None si la connexió no es pot mantenir"""
+        if self.headers.get('Expect') or 'chunked' in self.headers.get('Transfer-Encoding', '').lower():
+            return None
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            return None
+        if not 0 <= length <= MAX_KEEPALIVE_BODY:
+            return None
+        return self.rfile.read(length)
+
+    def run_wsgi(self):
+        self.keep_alive = False
+        body = self._read_body()
+        if body is None:
+            return super().run_wsgi()
+        self.keep_alive = True
+        self._body = body
+        rfile, self.rfile = self.rfile, io.BytesIO()
+        try:
+            return super().run_wsgi()
+        finally:
+            self.rfile = rfile
+
+    def make_environ(self):
+        environ = super().make_environ()
+        if self.keep_alive:
+            environ['wsgi.input'] = io.BytesIO(self._body)
+        return environ
+
+    def send_header(self, keyword, value):
+        if keyword.lower() == 'connection' and self.keep_alive and not self.close_connection:
+            return
+        super().send_header(keyword, value)
 
 def load_config(config_file):
     """
@@ -53,53 +124,17 @@ def setup_logging(log_mode):
 def create_connection(db_file: str) -> Optional[sqlite3.Connection]:
     """
     Crea una connexió a la base de dades SQLite
+    L'esquema (migracions) i els pragmas els aplica dbtools
     """
-    conn = None
-    try:
-        # Assegura't que el directori existeix
-        db_dir = path.dirname(db_file)
-        if db_dir and not path.exists(db_dir):
-            logging.info(f"Creant directori de base de dades: {db_dir}")
-            import os
-            os.makedirs(db_dir, exist_ok=True)
-        
-        if not path.isfile(db_file):
-            logging.info(f"Base de dades {db_file} no existeix. Creant nova base de dades.")
-            conn = sqlite3.connect(db_file)
-            
-            if path.isfile("base.sql"):
-                logging.info("Important esquema de base de dades des de base.sql")
-                with open('base.sql', 'r') as f:
-                    sql_statements = f.read().split(';')
-                    for statement in sql_statements:
-                        if statement.strip():
-                            conn.execute(statement)
-                conn.commit()
-                logging.info("Base de dades creada correctament")
-            else:
-                logging.warning("No s'ha trobat l'esquema de BD. Assegura't que base.sql existeix.")
-                return None
-        else:
-            logging.info(f"Connectant a la base de dades existent: {db_file}")
-            conn = sqlite3.connect(db_file)
-
-    except Error as e:
-        logging.error(f"Error connectant a la base de dades: {e}")
-        return None
-
-    return conn
+    return dbtools.create_connection(db_file)
 
-def add_link(conn: sqlite3.Connection, task: Tuple[datetime, str, str, Optional[int], str]) -> int:
+def add_link(conn: sqlite3.Connection, task: Tuple[datetime, str, str, Optional[int], str],
+             on_conflict: str = 'ignore') -> int:
     """
-    Afegeix un nou enllaç a la base de dades
+    Afegeix un nou enllaç a la base de dades (si la URL ja hi és, segons on_conflict)
     """
-    sql = '''INSERT INTO links(date, description, url, type, icon)
-             VALUES(?, ?, ?, ?, ?)'''
     try:
-        cur = conn.cursor()
-        cur.execute(sql, task)
-        conn.commit()
-        return cur.lastrowid
+        return dbtools.add_link(conn, task, on_conflict)
     except Error as e:
         logging.error(f"Error afegint l'enllaç: {e}")
         raise
@@ -115,6 +150,11 @@ def interactive_add_link(config_module, description: str, url: str, type_id: Opt
         
         link_id = add_link(conn, (datetime.now(), description, url, type_id, icon))
         conn.close()
+        rebuild_after_write(config_module)
+        # En mode interactiu s'espera la icona: el procés acaba tot seguit
+        future = localize_icons(config_module, [(link_id, icon, url)])
+        if future:
+            future.result()
         
         logging.info(f"Enllaç afegit correctament amb ID: {link_id}")
         print(f"Enllaç afegit correctament! ID: {link_id}")
@@ -124,16 +164,137 @@ def interactive_add_link(config_module, description: str, url: str, type_id: Opt
         print(f"Error: {e}")
         sys.exit(1)
 
+def get_link_writer(config_module):
+    """
+    Escriptor amb group commit per a les altes individuals
+    """
+    return get_writer(
+        config_module.dbpath,
+        max_batch=getattr(config_module, 'db_write_batch', 500),
+        max_delay=getattr(config_module, 'db_write_delay', 0.005),
+        queue_size=getattr(config_module, 'db_write_queue', 10000)
+    )
+
+def conflict_policy(config_module, requested=None):
+    """
+    Política on_conflict de la petició o, si no n'indica cap, de la configuració
+    :return: 'ignore', 'update', 'error' o None si no és vàlida
+    """
+    policy = requested or getattr(config_module, 'on_conflict', 'ignore')
+    return policy if policy in ON_CONFLICT_POLICIES else None
+
+def link_response(link_id, status):
+    """
+    Resposta de l'API segons el resultat d'insert_link
+    :return: (cos de la resposta, codi d'estat)
+    """
+    if status == 'duplicate':
+        return {"message": "L'enllaç ja existia", "id": link_id, "duplicate": True}, 200
+    if status == 'updated':
+        return {"message": "Enllaç actualitzat correctament!", "id": link_id, "updated": True}, 200
+    return {"message": "Enllaç afegit correctament!", "id": link_id}, 201
+
+def api_add_link(config_module, data):
+    """
+    Afegeix un enllaç a partir de les dades JSON de l'API
+    Es fa servir des de la ruta /api/addlink i des del transport en procés d'app.py
+    :return: (cos de la resposta, codi d'estat)
+    """
+    if not data:
+        return {"error": "No s'han rebut dades JSON"}, 400
+    
+    link, error = validate_link(data)
+    if error:
+        return {"error": error}, 400
+    description, url, type_id, icon = link
+    on_conflict = conflict_policy(config_module, data.get('on_conflict'))
+    if on_conflict is None:
+        return {"error": "on_conflict ha de ser ignore, update o error"}, 400
+
+    try:
+        link_id, status = get_link_writer(config_module).add(
+            (datetime.now(), description, url, type_id, icon), on_conflict=on_conflict)
+    except DuplicateLinkError as e:
+        return {"error": "L'enllaç ja existeix", "id": e.link_id}, 409
+    except queue.Full:
+        return {"error": "Massa escriptures pendents, torna-ho a provar"}, 503
+    except Exception as e:
+        return {"error": "Error escrivint a la base de dades", "details": str(e)}, 500
+    if status != 'duplicate':
+        rebuild_after_write(config_module)
+        localize_icons(config_module, [(link_id, icon, url)])
+    
+    logging.info(f"Enllaç via API amb ID {link_id}: {status}")
+    return link_response(link_id, status)
+
+def api_add_links(config_module, data, on_conflict=None):
+    """
+    Afegeix una llista d'enllaços en una sola transacció
+    :param on_conflict: política per a les URL repetides (per defecte, la de la configuració)
+    :return: (cos de la resposta, codi d'estat)
+    """
+    if not isinstance(data, list) or not data:
+        return {"error": "S'esperava una llista JSON d'enllaços"}, 400
+    policy = conflict_policy(config_module, on_conflict)
+    if policy is None:
+        return {"error": "on_conflict ha de ser ignore, update o error"}, 400
+
+    try:
+        with get_pool(config_module.dbpath).connection() as conn:
+            if not conn:
+                return {"error": "No s'ha pogut connectar a la base de dades"}, 500
+            results = add_links_bulk(conn, data, policy)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+    inserted = sum(1 for r in results if "error" not in r)
+    written = [r for r in results if r.get("status") in ('inserted', 'updated')]
+    if written:
+        rebuild_after_write(config_module)
+        links = [(r["id"], validate_link(data[r["index"]])[0]) for r in written]
+        localize_icons(config_module, [(link_id, icon, url) for link_id, (_, url, _, icon) in links])
+
+    logging.info(f"Enllaços afegits via API en bloc: {inserted} de {len(results)}")
+    status = 201 if inserted == len(results) else (207 if inserted else 400)
+    return {"inserted": inserted, "failed": len(results) - inserted, "results": results}, status
+
+def health(config_module):
+    """
+    Comprova que la base de dades respon
+    :return: (cos de la resposta, codi d'estat)
+    """
+    try:
+        with get_pool(config_module.dbpath).connection() as conn:
+            if conn:
+                conn.execute("SELECT 1")
+                return {"status": "healthy", "database": "connected",
+                        "writer": get_link_writer(config_module).stats()}, 200
+            else:
+                return {"status": "unhealthy", "database": "disconnected"}, 503
+    except Exception as e:
+        return {"status": "unhealthy", "error": str(e)}, 503
+
 def create_web_app(config_module):
     """
     Crea una aplicació Flask standalone per afegir enllaços
     """
     app = Flask(__name__)
     
-    # Configura templates si existeix el directori
+    # Pool de connexions persistents a la BD (una per fil)
+    db_pool = get_pool(
+        config_module.dbpath,
+        max_size=getattr(config_module, 'db_pool_size', 8),
+        idle_timeout=getattr(config_module, 'db_idle_timeout', 300.0)
+    )
+    
+    # Taula type en memòria: es recarrega només si change_log.type_version canvia
+    type_cache = TypeCache()
+    
+    # Templates del tema amb fallback precompilat i cau de bytecode a disc
     template_dir = path.join(path.dirname(__file__), "templates", getattr(config_module, 'theme', 'default'))
     if path.exists(template_dir):
         app.template_folder = template_dir
+    templating.configure(app, config_module, template_dir)
 
     @app.errorhandler(500)
     def internal_error(error):
@@ -148,81 +309,45 @@ def create_web_app(config_module):
     @app.route('/', methods=['GET', 'POST'])
     def index():
         try:
-            conn = create_connection(config_module.dbpath)
-            if not conn:
-                return jsonify({"error": "No s'ha pogut connectar a la base de dades"}), 500
+            with db_pool.connection() as conn:
+                if not conn:
+                    return jsonify({"error": "No s'ha pogut connectar a la base de dades"}), 500
 
-            if request.method == 'POST':
-                description = request.form.get('description', '').strip()
-                url = request.form.get('url', '').strip()
-                type_id = request.form.get('type_id')
-                icon = request.form.get('icon', '').strip()
+                if request.method == 'POST':
+                    description = request.form.get('description', '').strip()
+                    url = request.form.get('url', '').strip()
+                    type_id = request.form.get('type_id')
+                    icon = request.form.get('icon', '').strip()
                 
-                # Validació bàsica
-                if not description or not url:
-                    return jsonify({"error": "Descripció i URL són obligatoris"}), 400
+                    # Validació bàsica
+                    if not description or not url:
+                        return jsonify({"error": "Descripció i URL són obligatoris"}), 400
                 
-                if type_id:
-                    try:
-                        type_id = int(type_id)
-                    except ValueError:
-                        type_id = None
+                    if type_id:
+                        try:
+                            type_id = int(type_id)
+                        except ValueError:
+                            type_id = None
                 
-                link_id = add_link(conn, (datetime.now(), description, url, type_id, icon))
-                conn.close()
+                    try:
+                        link_id, status = get_link_writer(config_module).add(
+                            (datetime.now(), description, url, type_id, icon),
+                            on_conflict=conflict_policy(config_module) or 'ignore')
+                    except DuplicateLinkError as e:
+                        return jsonify({"error": "L'enllaç ja existeix", "id": e.link_id}), 409
+                    if status != 'duplicate':
+                        rebuild_after_write(config_module)
+                        localize_icons(config_module, [(link_id, icon, url)])
                 
-                logging.info(f"Enllaç afegit via web amb ID: {link_id}")
-                return jsonify({"message": "Enllaç afegit correctament!", "id": link_id}), 201
+                    logging.info(f"Enllaç via web amb ID {link_id}: {status}")
+                    body, code = link_response(link_id, status)
+                    return jsonify(body), code
             
-            # GET request - mostra el formulari
-            cur = conn.cursor()
-            cur.execute("SELECT * FROM type")
-            types = cur.fetchall()
-            conn.close()
+                # GET request - mostra el formulari
+                types = type_cache.get(conn)
             
-            # Si hi ha templates, usa'ls
-            if path.exists(app.template_folder):
+                # Template del tema o, si no n'hi ha, el formulari simple precompilat
                 return render_template('addlink.html', types=types)
-            else:
-                # Formulari HTML simple
-                form_html = """
-                <!DOCTYPE html>
-                <html>
-                <head><title>Afegir Enllaç</title></head>
-                <body>
-                    <h2>Afegir Nou Enllaç</h2>
-                    <form method="post">
-                        <p>
-                            <label>Descripció:</label><br>
-                            <input type="text" name="description" required>
-                        </p>
-                        <p>
-                            <label>URL:</label><br>
-                            <input type="url" name="url" required>
-                        </p>
-                        <p>
-                            <label>Tipus:</label><br>
-                            <select name="type_id">
-                                <option value="">Selecciona un tipus</option>
-                """
-                for type_row in types:
-                    form_html += f'<option value="{type_row[0]}">{type_row[1]}</option>'
-                
-                form_html += """
-                            </select>
-                        </p>
-                        <p>
-                            <label>Icona:</label><br>
-                            <input type="text" name="icon">
-                        </p>
-                        <p>
-                            <input type="submit" value="Afegir Enllaç">
-                        </p>
-                    </form>
-                </body>
-                </html>
-                """
-                return form_html
                 
         except Exception as e:
             logging.error(f"Error en la ruta index: {e}")
@@ -231,28 +356,18 @@ def create_web_app(config_module):
     @app.route('/api/addlink', methods=['POST'])
     def api_addlink():
         try:
-            conn = create_connection(config_module.dbpath)
-            if not conn:
-                return jsonify({"error": "No s'ha pogut connectar a la base de dades"}), 500
-
-            data = request.get_json()
-            if not data:
-                return jsonify({"error": "No s'han rebut dades JSON"}), 400
-            
-            description = data.get('description', '').strip()
-            url = data.get('url', '').strip()
-            type_id = data.get('type_id')
-            icon = data.get('icon', '').strip()
-
-            if not description or not url:
-                return jsonify({"error": "Descripció i URL són obligatoris"}), 400
-
-            link_id = add_link(conn, (datetime.now(), description, url, type_id, icon))
-            conn.close()
-            
-            logging.info(f"Enllaç afegit via API amb ID: {link_id}")
-            return jsonify({"message": "Enllaç afegit correctament!", "id": link_id}), 201
+            body, status = api_add_link(config_module, request.get_json(silent=True))
+            return jsonify(body), status
+        except Exception as e:
+            logging.error(f"Error en l'API: {e}")
+            return jsonify({"error": "Error processant la sol·licitud", "details": str(e)}), 500
 
+    @app.route('/api/addlinks', methods=['POST'])
+    def api_addlinks():
+        """Afegeix una llista d'enllaços en una sola transacció"""
+        try:
+            body, status = api_add_links(config_module, request.get_json(silent=True), request.args.get('on_conflict'))
+            return jsonify(body), status
         except Exception as e:
             logging.error(f"Error en l'API: {e}")
             return jsonify({"error": "Error processant la sol·licitud", "details": str(e)}), 500
@@ -260,16 +375,10 @@ def create_web_app(config_module):
     @app.route('/health', methods=['GET'])
     def health_check():
         """Endpoint per verificar que el servei funciona"""
-        try:
-            conn = create_connection(config_module.dbpath)
-            if conn:
-                conn.close()
-                return jsonify({"status": "healthy", "database": "connected"}), 200
-            else:
-                return jsonify({"status": "unhealthy", "database": "disconnected"}), 503
-        except Exception as e:
-            return jsonify({"status": "unhealthy", "error": str(e)}), 503
+        body, status = health(config_module)
+        return jsonify(body), status
 
+    templating.warm_up(app, ('addlink.html',))
     return app
 
 def main():
@@ -289,6 +398,10 @@ def main():
     parser.add_argument('--host', type=str, default='127.0.0.1', help='Host del servidor web')
     parser.add_argument('--port', type=int, default=5001, help='Port del servidor web')
     parser.add_argument('--debug', action='store_true', help='Mode debug')
+    parser.add_argument('--ready-fd', type=int, default=None,
+                       help='Descriptor heretat on s\'avisa quan el servidor ja escolta')
+    parser.add_argument('--asgi', action='store_true',
+                       help='Amb --web, serveix l\'API amb asyncio (uvicorn)')
     
     args = parser.parse_args()
 
@@ -304,7 +417,21 @@ def main():
             # Mode servidor web
             app = create_web_app(config)
             logging.info(f"Iniciant servidor web a {args.host}:{args.port}")
-            app.run(host=args.host, port=args.port, debug=args.debug)
+            if args.asgi:
+                from asyncapi import AsyncApi, serve, wsgi_fallback
+                api = AsyncApi(config, fallback=wsgi_fallback(app))
+                serve(api, args.host, args.port, ready_fd=args.ready_fd)
+            elif args.ready_fd is not None:
+                # El procés pare espera en aquest descriptor: s'avisa just
+                # després d'obrir el socket, abans d'atendre cap petició
+                server = make_server(args.host, args.port, app, threaded=True,
+                                     request_handler=KeepAliveRequestHandler)
+                os.write(args.ready_fd, b'ready\n')
+                os.close(args.ready_fd)
+                server.serve_forever()
+            else:
+                app.run(host=args.host, port=args.port, debug=args.debug,
+                        request_handler=KeepAliveRequestHandler)
         else:
             # Mode línia de comandes
             if args.description and args.url:
@@ -1,76 +1,298 @@
-from flask import Flask, request, render_template, jsonify, redirect, url_for, flash
+from flask import Flask, Response, request, render_template, jsonify, redirect, url_for, flash, make_response, g, session
+from werkzeug.http import is_resource_modified
 from datetime import datetime
-from dbtools import create_connection, add_link, get_links
-try:
-    from preview_routes import preview_bp
-except ImportError:
-    print("Warning: preview_routes not found, creating empty blueprint")
-    from flask import Blueprint
-    preview_bp = Blueprint('preview', __name__)
+from sqlite3 import Error
+from dbtools import get_pool, validate_link, DuplicateLinkError, get_links_page, MAX_LINKS_LIMIT, iter_links, get_change_token, search_links, MAX_SEARCH_LIMIT, get_dead_links, TypeCache, parse_fields, to_columnar, DEFAULT_LINK_FIELDS
+from staticsite import rebuild_after_write, templates_fingerprint
+from cache import LRUCache
+from clicks import ClickCounter
+from icons import get_icon_store, localize_icons
+import templating
+from addlink import conflict_policy, link_response, get_link_writer, api_add_links
+from preview_routes import preview_bp, PreviewService
 import os
+import io
+import csv
+import json
+import zlib
+import hashlib
+import functools
 import sys
 import importlib.util
 import argparse
-import requests
+import queue
+from urllib.parse import urlencode
+from transports import create_transport, TransportError
 import subprocess
+import select
+import tempfile
 import time
 import signal
 import atexit
-from threading import Thread
+from threading import Thread, Event, Lock
+from collections import deque
+
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+class CircuitBreaker:
+    """
+    Circuit breaker per a les crides al servei addlink.
+    Després de failure_threshold errors seguits s'obre i les crides fallen
+    a l'instant; passat reset_timeout deixa passar una crida de prova.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=3, reset_timeout=10):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.opened_at = 0.0
+        self._lock = Lock()
+
+    def allow(self):
+        """Indica si es pot fer una crida al servei"""
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            return self.state != self.OPEN
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.state = self.CLOSED
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.failure_threshold):
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self.trips += 1
+
+    def stats(self):
+        with self._lock:
+            return {"state": self.state, "failures": self.failures, "trips": self.trips}
 
 class AddLinkService:
     """
-    Classe per gestionar el servei addlink com a procés separat
+    Classe per gestionar el servei addlink, com a procés separat (TCP o
+    socket Unix) o dins del mateix procés, segons el transport
     """
-    def __init__(self, config_file, host='127.0.0.1', port=5001):
+    def __init__(self, config_file, host='127.0.0.1', port=5001,
+                 pool_size=10, connect_timeout=2, read_timeout=10,
+                 failure_threshold=3, reset_timeout=10,
+                 transport='tcp', socket_path='addlink.sock', config_module=None):
         self.config_file = config_file
         self.host = host
         self.port = port
         self.process = None
-        self.base_url = f"http://{host}:{port}"
-        
-    def start(self):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+
+        # Transport cap al servei (tcp amb keep-alive, socket Unix o en procés)
+        self._transport_args = dict(
+            kind=transport, config_module=config_module, host=host, port=port, socket_path=socket_path,
+            pool_size=pool_size, connect_timeout=connect_timeout, read_timeout=read_timeout
+        )
+        self.transport = create_transport(**self._transport_args)
+        # Només el transport TCP té una URL que el navegador pugui obrir (iframe)
+        self.base_url = self.transport.base_url
+
+        # Estat de salut en cau (l'actualitza el fil monitor) i circuit breaker
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self._healthy = False
+        self._last_check = None
+        self._latencies = deque(maxlen=50)
+        self._monitor = None
+        self._monitor_stop = Event()
+
+    @property
+    def address(self):
+        """Adreça llegible del servei segons el transport"""
+        if self.transport.name == 'unix':
+            return f"unix://{self.transport.socket_path}"
+        return self.base_url or self.transport.name
+
+    def _request(self, method, path, read_timeout=None, json=None):
+        """
+        Fa una petició al servei pel transport
+        :return: (codi d'estat, cos)
+        """
+        started = time.monotonic()
+        try:
+            return self.transport.request(method, path, json=json, read_timeout=read_timeout)
+        finally:
+            self._latencies.append(time.monotonic() - started)
+
+    def _call(self, method, path, read_timeout=None, json=None):
+        """
+        Crida protegida pel circuit breaker. Retorna (codi, cos) o None si el
+        servei no està disponible (circuit obert, error de transport o 5xx).
+        """
+        if not self.breaker.allow():
+            return None
+        try:
+            status, body = self._request(method, path, read_timeout=read_timeout, json=json)
+        except TransportError:
+            self.breaker.record_failure()
+            self._healthy = False
+            return None
+        if status >= 500:
+            self.breaker.record_failure()
+            return None
+        self.breaker.record_success()
+        return status, body
+
+    def connection_stats(self):
+        """Estadístiques de reutilització de connexions del transport"""
+        return self.transport.stats()
+
+    def health_stats(self):
+        """Estat de salut en cau, latència recent i estat del circuit breaker"""
+        latencies = list(self._latencies)
+        return {
+            "healthy": self._healthy,
+            "monitor": self._monitor is not None and self._monitor.is_alive(),
+            "last_check_age": None if self._last_check is None else round(time.monotonic() - self._last_check, 3),
+            "latency_ms": {
+                "last": round(latencies[-1] * 1000, 2) if latencies else None,
+                "avg": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else None,
+                "max": round(max(latencies) * 1000, 2) if latencies else None
+            },
+            "breaker": self.breaker.stats()
+        }
+
+    def start(self, timeout=30):
         """Inicia el servei addlink"""
         try:
-            # Comprova si ja està funcionant
-            if self.is_running():
-                print(f"Servei addlink ja està funcionant a {self.base_url}")
+            # Comprova si ja està funcionant (en procés sempre ho està)
+            server_args = self.transport.server_args(self.host, self.port)
+            if self.check_health():
+                print(f"Servei addlink ja està funcionant a {self.address}")
                 return True
+            if server_args is None:
+                return False
                 
-            print(f"Iniciant servei addlink a {self.base_url}...")
+            print(f"Iniciant servei addlink a {self.address}...")
             
             # Inicia el procés addlink
             cmd = [
                 sys.executable, 'addlink.py',
                 '-c', self.config_file,
                 '--web',
-                '--host', self.host,
-                '--port', str(self.port),
+                *server_args,
                 '--log', 'file'
             ]
             
+            # El fill avisa per una pipe heretada quan ja escolta (només POSIX)
+            read_fd = write_fd = None
+            if os.name == 'posix':
+                read_fd, write_fd = os.pipe()
+                cmd += ['--ready-fd', str(write_fd)]
+            
+            # Es guarda la sortida del fill (stderr i els errors que escriu a
+            # stdout) per mostrar-la si no arrenca
+            self._output = tempfile.TemporaryFile()
             self.process = subprocess.Popen(
                 cmd,
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL
+                stdout=self._output,
+                stderr=subprocess.STDOUT,
+                pass_fds=(write_fd,) if write_fd is not None else ()
             )
+            if write_fd is not None:
+                os.close(write_fd)
             
-            # Espera que el servei estigui llest
-            for _ in range(30):  # Màxim 30 segons
-                if self.is_running():
-                    print(f"✅ Servei addlink iniciat correctament")
-                    return True
-                time.sleep(1)
+            if self._wait_ready(read_fd, timeout):
+                self.check_health()
+                print(f"✅ Servei addlink iniciat correctament")
+                return True
                 
             print("❌ Error: El servei addlink no s'ha pogut iniciar")
+            output = self.child_output()
+            if output:
+                print(output)
             return False
             
         except Exception as e:
             print(f"Error iniciant servei addlink: {e}")
             return False
     
+    def _wait_ready(self, read_fd, timeout):
+        """
+        Espera el senyal de la pipe; si no n'hi ha (o el fill la tanca sense
+        avisar) consulta /health amb espera exponencial. Falla de seguida si
+        el procés fill acaba.
+        """
+        deadline = time.monotonic() + timeout
+        delay = 0.01
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self.process.poll() is not None:
+                    return False
+                if read_fd is not None:
+                    ready, _, _ = select.select([read_fd], [], [], min(remaining, 0.5))
+                    if ready:
+                        if os.read(read_fd, 64).startswith(b'ready'):
+                            return True
+                        # EOF sense avís: continua amb el sondeig de /health
+                        os.close(read_fd)
+                        read_fd = None
+                    continue
+                if self.check_health():
+                    return True
+                time.sleep(min(delay, remaining))
+                delay = min(delay * 2, 1)
+        finally:
+            if read_fd is not None:
+                os.close(read_fd)
+    
+    def child_output(self, limit=4096):
+        """Retorna el final de la sortida capturada del procés fill"""
+        if not getattr(self, '_output', None):
+            return ''
+        self._output.seek(0, os.SEEK_END)
+        size = self._output.tell()
+        self._output.seek(max(size - limit, 0))
+        return self._output.read().decode('utf-8', errors='replace').strip()
+
+    def start_monitor(self, interval=5):
+        """Inicia el fil que comprova la salut del servei en segon pla"""
+        if self._monitor is not None and self._monitor.is_alive():
+            return
+        self._monitor_stop.clear()
+
+        def run():
+            while not self._monitor_stop.wait(interval):
+                self.check_health()
+
+        self._monitor = Thread(target=run, name='addlink-health', daemon=True)
+        self._monitor.start()
+
+    def after_fork(self, interval=5):
+        """
+        Prepara l'objecte dins d'un worker acabat de crear amb fork():
+        connexions i fils del pare no es comparteixen, i el procés addlink
+        el continua gestionant el pare
+        """
+        self.process = None
+        self.transport = create_transport(**self._transport_args)
+        self.breaker = CircuitBreaker(self.breaker.failure_threshold, self.breaker.reset_timeout)
+        self._latencies = deque(maxlen=50)
+        self._monitor = None
+        self._monitor_stop = Event()
+        self.check_health()
+        self.start_monitor(interval)
+
     def stop(self):
         """Atura el servei addlink"""
+        self._monitor_stop.set()
+        self.transport.close()
         if self.process:
             try:
                 self.process.terminate()
@@ -81,38 +303,68 @@ class AddLinkService:
                 print("Servei addlink forçat a aturar")
             except Exception as e:
                 print(f"Error aturant servei addlink: {e}")
-    
-    def is_running(self):
-        """Comprova si el servei està funcionant"""
+
+    def check_health(self):
+        """Fa la comprovació /health real i actualitza l'estat en cau"""
         try:
-            response = requests.get(f"{self.base_url}/health", timeout=2)
-            return response.status_code == 200
+            status, _ = self._request('GET', '/health', read_timeout=self.connect_timeout)
+            healthy = status == 200
         except:
-            return False
-    
-    def add_link_via_api(self, description, url, type_id=None, icon=""):
-        """Afegeix un enllaç via API del servei"""
-        try:
-            data = {
-                "description": description,
-                "url": url,
-                "type_id": type_id,
-                "icon": icon
-            }
-            
-            response = requests.post(
-                f"{self.base_url}/api/addlink",
-                json=data,
-                timeout=10
-            )
-            
-            if response.status_code == 201:
-                return {"success": True, "data": response.json()}
-            else:
-                return {"success": False, "error": response.json()}
-                
-        except Exception as e:
-            return {"success": False, "error": str(e)}
+            healthy = False
+        if healthy:
+            self.breaker.record_success()
+        elif self.breaker.state != CircuitBreaker.OPEN:
+            self.breaker.record_failure()
+        self._healthy = healthy
+        self._last_check = time.monotonic()
+        return healthy
+
+    def is_running(self):
+        """
+        Comprova si el servei està funcionant. Amb el monitor actiu retorna
+        l'estat en cau sense fer cap petició HTTP.
+        """
+        if self._monitor is None or not self._monitor.is_alive():
+            return self.check_health()
+        return self._healthy and self.breaker.state != CircuitBreaker.OPEN
+
+    def add_link_via_api(self, description, url, type_id=None, icon="", on_conflict=None):
+        """
+        Afegeix un enllaç via API del servei.
+        Si el servei no està disponible el resultat porta 'unavailable'
+        perquè el cridador pugui escriure directament a la BD.
+        """
+        data = {
+            "description": description,
+            "url": url,
+            "type_id": type_id,
+            "icon": icon
+        }
+        if on_conflict:
+            data["on_conflict"] = on_conflict
+
+        response = self._call('POST', '/api/addlink', json=data)
+        if response is None:
+            return {"success": False, "unavailable": True, "error": "Servei addlink no disponible"}
+
+        status, body = response
+        if status in (200, 201):
+            return {"success": True, "status": status, "data": body}
+        else:
+            return {"success": False, "status": status, "error": body}
+
+    def add_links_via_api(self, links, on_conflict=None):
+        """Afegeix una llista d'enllaços via l'API en bloc del servei"""
+        path = '/api/addlinks' + (f'?{urlencode({"on_conflict": on_conflict})}' if on_conflict else '')
+        response = self._call('POST', path, read_timeout=60, json=links)
+        if response is None:
+            return {"success": False, "unavailable": True, "error": "Servei addlink no disponible"}
+
+        status, body = response
+        if status in (201, 207, 400):
+            return {"success": True, "status": status, "data": body}
+        else:
+            return {"success": False, "error": body}
 
 def load_config(config_file):
     """
@@ -139,36 +391,102 @@ def create_app(config_module, addlink_service):
     
     # Crea l'aplicació Flask amb la configuració personalitzada
     app = Flask(__name__, template_folder=custom_template_dir)
+    # Templates del tema amb fallback precompilat i cau de bytecode a disc
+    templating.configure(app, config_module, custom_template_dir)
     app.secret_key = getattr(config_module, 'secret_key', 'dev-secret-key-change-me')
     
-    # Registra el blueprint només si existeix
-    try:
-        app.register_blueprint(preview_bp)
-    except Exception as e:
-        print(f"Warning: Could not register preview_bp: {e}")
+    # Pool de connexions persistents a la BD (compartides entre fils)
+    db_pool = get_pool(
+        config_module.dbpath,
+        max_size=getattr(config_module, 'db_pool_size', 8),
+        idle_timeout=getattr(config_module, 'db_idle_timeout', 300.0)
+    )
+    
+    # Comptador de clics de /go/<id>: URL en memòria i escriptures per lots
+    click_counter = ClickCounter(
+        config_module.dbpath,
+        flush_interval=getattr(config_module, 'click_flush_interval', 5.0),
+        url_cache_size=getattr(config_module, 'click_url_cache_size', 10000)
+    )
+    track_clicks = getattr(config_module, 'track_clicks', True)
+    
+    def link_href(link):
+        """Enllaç de sortida: passa per /go/<id> si es compten els clics"""
+        return url_for('go', link_id=link[0]) if track_clicks else link[3]
+    app.jinja_env.globals['link_href'] = link_href
+    
+    # Icones desades localment (icons.py): /icons/<hash> no canvia mai de contingut
+    icon_store = get_icon_store(config_module)
+
+    # Enllaços morts segons linkcheck.py: 'flag' els marca a /view, 'hide' els amaga, 'show' no en fa res
+    dead_links = getattr(config_module, 'dead_links', 'flag')
+
+    # Taula type en memòria: es recarrega només si change_log.type_version canvia
+    type_cache = TypeCache()
+
+    # Cau de pàgines /view renderitzades, validada amb el comptador d'escriptures
+    view_cache = LRUCache(getattr(config_module, 'view_cache_size', 128))
+    
+    # Empremta dels templates: un desplegament amb templates nous invalida els ETag
+    templates_fp = templates_fingerprint(custom_template_dir)
+    
+    def has_flashes():
+        """
+        Missatges flash pendents. Sense cookie de sessió no n'hi pot haver i
+        no s'obre la sessió: llegir-la afegeix Vary: Cookie a la resposta
+        """
+        if app.config['SESSION_COOKIE_NAME'] not in request.cookies:
+            return False
+        return bool(session.get('_flashes'))
+    
+    def conditional(shows_flashes=False):
+        """
+        Afegeix un ETag a partir del comptador d'escriptures de la BD.
+        Si el client ja té la versió actual (If-None-Match) respon 304 sense
+        consultar la taula links ni renderitzar res. No s'envia Last-Modified:
+        change_log.modified té resolució d'un segon i dues escriptures dins
+        del mateix segon donarien un 304 d'una pàgina antiga.
+        :param shows_flashes: La pàgina mostra missatges flash (només les HTML)
+        """
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                # Amb missatges flash pendents la pàgina depèn de la sessió, no només de la BD
+                if shows_flashes and has_flashes():
+                    return view(*args, **kwargs)
+                with db_pool.connection() as conn:
+                    if not conn:
+                        return view(*args, **kwargs)
+                    version, _ = get_change_token(conn)
+                g.change_version = version
+                etag = hashlib.sha1(f"{templates_fp}:{version}:{request.full_path}".encode()).hexdigest()[:20]
+
+                if not is_resource_modified(request.environ, etag=etag):
+                    response = Response(status=304)
+                else:
+                    response = make_response(view(*args, **kwargs))
+                    # Les pàgines d'error no porten ETag
+                    if response.status_code != 200:
+                        return response
+                response.set_etag(etag)
+                response.headers['Cache-Control'] = 'no-cache'
+                return response
+            return wrapper
+        return decorator
+    
+    # Previsualitzacions: /view només llegeix la cau, les descàrregues van en segon pla
+    previews = PreviewService(config_module)
+    app.extensions['preview'] = previews
+    app.register_blueprint(preview_bp)
     
     @app.route('/', methods=['GET'])
     def home():
         try:
             return render_template('index.html')
         except Exception as e:
-            # Si no hi ha template, retorna HTML simple
+            # Si el template del tema falla, retorna la versió mínima
             print(f"Warning: Could not render index.html: {e}")
-            return '''
-            <!DOCTYPE html>
-            <html>
-            <head><title>SLink3 - Home</title></head>
-            <body>
-                <h1>Benvingut a SLink3</h1>
-                <ul>
-                    <li><a href="/addlink">Afegir Enllaç</a></li>
-                    <li><a href="/view">Veure Enllaços</a></li>
-                    <li><a href="/addlink_iframe">Afegir Enllaç (iframe)</a></li>
-                    <li><a href="/service/status">Estat Serveis</a></li>
-                </ul>
-            </body>
-            </html>
-            '''
+            return render_template('fallback/index.html')
 
     @app.route('/addlink', methods=['GET', 'POST'])
     def addlink_page():
@@ -193,86 +511,57 @@ def create_app(config_module, addlink_service):
                 except ValueError:
                     type_id = None
             
-            # Si hi ha servei addlink, l'utilitza
+            # Si hi ha servei addlink, l'utilitza (l'estat ve de la cau del monitor)
             if addlink_service and addlink_service.is_running():
                 result = addlink_service.add_link_via_api(description, url, type_id, icon)
                 
                 if result['success']:
-                    flash('Enllaç afegit correctament!', 'success')
+                    view_cache.clear()
+                    flash(result['data'].get('message', 'Enllaç afegit correctament!'), 'success')
                     return redirect(url_for('view_links'))
-                else:
+                elif not result.get('unavailable'):
                     flash(f'Error afegint l\'enllaç: {result["error"]}', 'error')
                     return redirect(url_for('addlink_page'))
-            else:
-                # Fallback: afegeix directament a la BD
-                try:
-                    conn = create_connection(config_module.dbpath)
-                    if conn:
-                        add_link(conn, (datetime.now(), description, url, type_id, icon))
-                        conn.close()
-                        return '<h2>Enllaç afegit correctament!</h2><a href="/view">Veure enllaços</a> | <a href="/addlink">Afegir altre</a>'
-                    else:
-                        return '<h2>Error de connexió a la base de dades</h2><a href="/addlink">Tornar</a>'
-                except Exception as e:
-                    return f'<h2>Error: {e}</h2><a href="/addlink">Tornar</a>'
+                # Servei no disponible o circuit obert: continua pel fallback
+
+            # Fallback: afegeix directament a la BD
+            try:
+                link_id, status = get_link_writer(config_module).add((datetime.now(), description, url, type_id, icon),
+                                                on_conflict=conflict_policy(config_module) or 'ignore')
+                if status != 'duplicate':
+                    view_cache.clear()
+                    rebuild_after_write(config_module)
+                    localize_icons(config_module, [(link_id, icon, url)])
+                message = link_response(link_id, status)[0]['message']
+                return f'<h2>{message}</h2><a href="/view">Veure enllaços</a> | <a href="/addlink">Afegir altre</a>'
+            except DuplicateLinkError:
+                return '<h2>Error: L\'enllaç ja existeix</h2><a href="/addlink">Tornar</a>'
+            except Exception as e:
+                return f'<h2>Error: {e}</h2><a href="/addlink">Tornar</a>'
         
         # GET request - mostra el formulari
         try:
-            conn = create_connection(config_module.dbpath)
-            if not conn:
-                flash('Error de connexió a la base de dades', 'error')
-                return redirect(url_for('home'))
+            with db_pool.connection() as conn:
+                if not conn:
+                    flash('Error de connexió a la base de dades', 'error')
+                    return redirect(url_for('home'))
 
-            cur = conn.cursor()
-            cur.execute("SELECT * FROM type")
-            types = cur.fetchall()
-            conn.close()
-            
+                types = type_cache.get(conn)
+        except Exception as e:
+            print(f"Error in addlink_page: {e}")
+            types = []
+
+        try:
             return render_template('addlink.html', types=types)
-            
         except Exception as e:
             print(f"Error in addlink_page: {e}")
-            # Fallback: formulari HTML simple si no hi ha template
-            types_options = ""
-            try:
-                conn = create_connection(config_module.dbpath)
-                if conn:
-                    cur = conn.cursor()
-                    cur.execute("SELECT * FROM type")
-                    types = cur.fetchall()
-                    conn.close()
-                    for type_row in types:
-                        types_options += f'<option value="{type_row[0]}">{type_row[1]}</option>'
-            except:
-                pass
-                
-            return f'''
-            <!DOCTYPE html>
-            <html>
-            <head><title>Afegir Enllaç</title></head>
-            <body>
-                <h2>Afegir Nou Enllaç</h2>
-                <form method="post">
-                    <p><label>Descripció:</label><br><input type="text" name="description" required></p>
-                    <p><label>URL:</label><br><input type="url" name="url" required></p>
-                    <p><label>Tipus:</label><br>
-                       <select name="type_id">
-                           <option value="">Selecciona un tipus</option>
-                           {types_options}
-                       </select>
-                    </p>
-                    <p><label>Icona:</label><br><input type="text" name="icon"></p>
-                    <p><input type="submit" value="Afegir Enllaç"></p>
-                </form>
-                <a href="/">← Tornar</a>
-            </body>
-            </html>
-            '''
+            # Fallback: formulari simple (amb els mateixos tipus)
+            return render_template('fallback/addlink.html', types=types)
 
     @app.route('/addlink_iframe')
     def addlink_iframe():
         """Mostra addlink en un iframe del servei separat"""
-        if not addlink_service or not addlink_service.is_running():
+        if not addlink_service or not addlink_service.base_url or not addlink_service.is_running():
             return '''
             <h2>El servei addlink no està disponible</h2>
             <p>Prova d'utilitzar <a href="/addlink">el formulari integrat</a></p>
@@ -283,100 +572,304 @@ def create_app(config_module, addlink_service):
             return render_template('addlink_iframe.html', 
                                  addlink_url=addlink_service.base_url)
         except:
-            return f'''
-            <iframe src="{addlink_service.base_url}" width="100%" height="600px"></iframe>
-            <a href="/">← Tornar</a>
-            '''
+            return render_template('fallback/addlink_iframe.html', addlink_url=addlink_service.base_url)
 
     @app.route('/view', methods=['GET'])
+    @conditional(shows_flashes=True)
     def view_links():
         try:
-            conn = create_connection(config_module.dbpath)
-            if not conn:
-                return '<h2>Error de connexió a la base de dades</h2><a href="/">← Tornar</a>'
-
             order = request.args.get('order', 'desc')
-            limit = int(request.args.get('limit', 10))
+            limit = max(1, min(request.args.get('limit', 10, type=int), MAX_LINKS_LIMIT))
+            after = request.args.get('after')
+            type_id = request.args.get('type', type=int)
 
-            links = get_links(conn, order=order, limit=limit)
-            conn.close()
+            # Les entrades porten la versió de la BD amb què es van renderitzar,
+            # així les escriptures d'altres processos (servei addlink) també les invaliden.
+            # Les pàgines amb missatges flash són per a un sol usuari i no es desen.
+            version = g.get('change_version')
+            cacheable = version is not None and not has_flashes()
+            cache_key = ('view', request.full_path)
+            if cacheable:
+                cached = view_cache.get(cache_key)
+                if cached is not None and cached[0] == version:
+                    return cached[1]
 
+            with db_pool.connection() as conn:
+                if not conn:
+                    return '<h2>Error de connexió a la base de dades</h2><a href="/">← Tornar</a>', 500
+                links, next_cursor = get_links_page(conn, order=order, limit=limit, after=after, type_id=type_id,
+                                                    hide_dead=dead_links == 'hide', type_names=True)
+                dead = get_dead_links(conn, [link[0] for link in links]) if dead_links == 'flag' else set()
+                link_previews = previews.get_many(conn, links)
+
+            next_url = None
+            if next_cursor:
+                next_url = url_for('view_links', order=order, limit=limit, type=type_id, after=next_cursor)
+
+            context = dict(links=links, next_cursor=next_cursor, next_url=next_url,
+                           dead=dead, previews=link_previews)
             try:
-                return render_template('view.html', links=links)
+                body = render_template('view.html', **context)
             except:
-                # Fallback HTML
-                links_html = ""
-                for link in links:
-                    links_html += f'''
-                    <li>
-                        <strong>{link[2]}</strong><br>
-                        <a href="{link[3]}" target="_blank">{link[3]}</a><br>
-                        <small>Data: {link[1]} | Tipus: {link[5]} | Icona: {link[4]}</small>
-                    </li>
-                    '''
-                
-                return f'''
-                <!DOCTYPE html>
-                <html>
-                <head><title>Enllaços</title></head>
-                <body>
-                    <h2>Enllaços ({len(links)})</h2>
-                    <ul>{links_html}</ul>
-                    <a href="/">← Tornar</a>
-                </body>
-                </html>
-                '''
+                # Fallback: llista simple precompilada
+                body = render_template('fallback/view.html', **context)
+
+            if cacheable:
+                view_cache.set(cache_key, (version, body))
+            return body
+        except ValueError as e:
+            # Cursor o paràmetres incorrectes
+            return f'<h2>Error: {e}</h2><a href="/">← Tornar</a>', 400
         except Exception as e:
-            return f'<h2>Error: {e}</h2><a href="/">← Tornar</a>'
+            return f'<h2>Error: {e}</h2><a href="/">← Tornar</a>', 500
+
+    @app.route('/icons/<icon_hash>', methods=['GET'])
+    def icon_file(icon_hash):
+        """Icona desada localment, amb capçaleres de cau d'un any (el nom és el hash del contingut)"""
+        found = icon_store.read(icon_hash) if icon_store else None
+        if found is None:
+            return jsonify({"error": "Icona no trobada"}), 404
+        data, mimetype = found
+        if not is_resource_modified(request.environ, etag=icon_hash):
+            response = Response(status=304)
+        else:
+            response = Response(data, mimetype=mimetype)
+            # Els SVG poden portar scripts: no s'executen mai des d'aquest origen
+            response.headers['Content-Security-Policy'] = "default-src 'none'; style-src 'unsafe-inline'"
+            response.headers['X-Content-Type-Options'] = 'nosniff'
+        response.set_etag(icon_hash)
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+        return response
+
+    @app.route('/go/<int:link_id>', methods=['GET'])
+    def go(link_id):
+        """Redirigeix a l'enllaç i compta el clic en memòria"""
+        url = click_counter.resolve(link_id)
+        if url is None:
+            return jsonify({"error": "Enllaç no trobat"}), 404
+        click_counter.hit(link_id)
+        return redirect(url, 302)
 
     @app.route('/api/links', methods=['GET'])
+    @conditional()
     def api_links():
-        conn = create_connection(config_module.dbpath)
-        if not conn:
-            return jsonify({"error": "Unable to establish a connection to the database."}), 500
-
+        """
+        Llista d'enllaços. ?fields=id,url només llegeix (i envia) aquests camps;
+        ?format=columnar respon {"columns": [...], "data": [una llista per columna]}
+        """
         order = request.args.get('order', 'desc') 
-        limit = int(request.args.get('limit', 10))
+        try:
+            limit = max(1, min(int(request.args.get('limit', 10)), MAX_LINKS_LIMIT))
+        except ValueError:
+            return jsonify({"error": "El paràmetre limit ha de ser un enter"}), 400
+        after = request.args.get('after')
+        type_id = request.args.get('type', type=int)
+        fmt = request.args.get('format')
+        if fmt not in (None, 'rows', 'columnar'):
+            return jsonify({"error": "Format no suportat (rows o columnar)"}), 400
+        try:
+            fields = parse_fields(request.args.get('fields'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
-        links = get_links(conn, order=order, limit=limit)
-        conn.close()
+        with db_pool.connection() as conn:
+            if not conn:
+                return jsonify({"error": "Unable to establish a connection to the database."}), 500
+            try:
+                links, next_cursor = get_links_page(conn, order=order, limit=limit, after=after, type_id=type_id,
+                                                    fields=fields)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
 
-        return jsonify(links), 200
+        # El cos continua sent la llista d'enllaços; el cursor de la pàgina
+        # següent viatja a les capçaleres (?after=<cursor>)
+        if fmt == 'columnar':
+            response = jsonify(to_columnar(fields or DEFAULT_LINK_FIELDS, links))
+        else:
+            response = jsonify(links)
+        if next_cursor:
+            next_url = url_for('api_links', order=order, limit=limit, type=type_id, after=next_cursor,
+                               fields=request.args.get('fields'), format=fmt)
+            response.headers['X-Next-Cursor'] = next_cursor
+            response.headers['Link'] = f'<{next_url}>; rel="next"'
+        return response, 200
+
+    @app.route('/api/search', methods=['GET'])
+    @conditional()
+    def api_search():
+        """
+        Cerca de text complet (FTS5) sobre descripció i URL, per rellevància.
+        Amb mode=prefix l'última paraula es cerca com a prefix (autocompletar).
+        """
+        q = request.args.get('q', '')
+        mode = request.args.get('mode')
+        limit = max(1, min(request.args.get('limit', 10, type=int), MAX_SEARCH_LIMIT))
+        after = request.args.get('after')
+
+        with db_pool.connection() as conn:
+            if not conn:
+                return jsonify({"error": "Unable to establish a connection to the database."}), 500
+            try:
+                links, next_cursor = search_links(conn, q, limit=limit, after=after, prefix=mode == 'prefix')
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            except Error as e:
+                return jsonify({"error": "Cerca no disponible", "details": str(e)}), 503
+
+        response = jsonify(links)
+        if next_cursor:
+            next_url = url_for('api_search', q=q, mode=mode, limit=limit, after=next_cursor)
+            response.headers['X-Next-Cursor'] = next_cursor
+            response.headers['Link'] = f'<{next_url}>; rel="next"'
+        return response, 200
+
+    @app.route('/api/links/export', methods=['GET'])
+    def api_links_export():
+        """
+        Exporta tots els enllaços en streaming (NDJSON o CSV) sense carregar
+        la taula a memòria; comprimeix amb gzip al vol si el client ho accepta
+        """
+        fmt = request.args.get('format', 'ndjson')
+        if fmt not in ('ndjson', 'csv'):
+            return jsonify({"error": "Format no suportat (ndjson o csv)"}), 400
+        order = request.args.get('order', 'asc')
+        use_gzip = request.args.get('gzip') != '0' and 'gzip' in request.accept_encodings
+
+        def rows_to_text():
+            with db_pool.connection() as conn:
+                if not conn:
+                    return
+                rows = iter_links(conn, order=order)
+                columns = next(rows)
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                if fmt == 'csv':
+                    writer.writerow(columns)
+                for row in rows:
+                    if fmt == 'csv':
+                        writer.writerow(row)
+                    else:
+                        buffer.write(json.dumps(dict(zip(columns, row)), default=str))
+                        buffer.write('\n')
+                    # Envia blocs d'uns 64 KB en lloc d'una línia per fila
+                    if buffer.tell() >= EXPORT_CHUNK_SIZE:
+                        yield buffer.getvalue()
+                        buffer.seek(0)
+                        buffer.truncate()
+                if buffer.tell():
+                    yield buffer.getvalue()
+
+        def gzipped(chunks):
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+            for chunk in chunks:
+                data = compressor.compress(chunk.encode('utf-8'))
+                if data:
+                    yield data
+            yield compressor.flush()
+
+        body = rows_to_text()
+        mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+        response = Response(gzipped(body) if use_gzip else body, mimetype=mimetype)
+        response.headers['Content-Disposition'] = f'attachment; filename=links.{fmt}'
+        if use_gzip:
+            response.headers['Content-Encoding'] = 'gzip'
+            response.headers['Vary'] = 'Accept-Encoding'
+        return response
 
     @app.route('/api/addlink', methods=['POST'])
     def api_addlink():
         """API que delega al servei addlink"""
-        data = request.get_json()
+        data = request.get_json(silent=True)
         if not data:
             return jsonify({"error": "No s'han rebut dades JSON"}), 400
         
-        description = data.get('description', '').strip()
-        url = data.get('url', '').strip()
-        type_id = data.get('type_id')
-        icon = data.get('icon', '').strip()
-
-        if not description or not url:
-            return jsonify({"error": "Descripció i URL són obligatoris"}), 400
+        link, error = validate_link(data)
+        if error:
+            return jsonify({"error": error}), 400
+        description, url, type_id, icon = link
+        on_conflict = conflict_policy(config_module, data.get('on_conflict'))
+        if on_conflict is None:
+            return jsonify({"error": "on_conflict ha de ser ignore, update o error"}), 400
 
         # Delega al servei addlink
-        result = addlink_service.add_link_via_api(description, url, type_id, icon)
-        
-        if result['success']:
-            return jsonify(result['data']), 201
-        else:
-            return jsonify({"error": result['error']}), 500
+        if addlink_service and addlink_service.is_running():
+            result = addlink_service.add_link_via_api(description, url, type_id, icon, on_conflict)
+            
+            if result['success']:
+                view_cache.clear()
+                return jsonify(result['data']), result['status']
+            elif not result.get('unavailable'):
+                # Els errors del servei ja són un cos JSON {"error": ...}: es retornen tal qual
+                error = result['error'] if isinstance(result['error'], dict) else {"error": result['error']}
+                return jsonify(error), result.get('status', 500)
+
+        # Fallback: el servei no respon o el circuit està obert
+        try:
+            link_id, status = get_link_writer(config_module).add((datetime.now(), description, url, type_id, icon),
+                                            on_conflict=on_conflict)
+        except DuplicateLinkError as e:
+            return jsonify({"error": "L'enllaç ja existeix", "id": e.link_id}), 409
+        except queue.Full:
+            return jsonify({"error": "Massa escriptures pendents, torna-ho a provar"}), 503
+        except Exception as e:
+            return jsonify({"error": "Error escrivint a la base de dades", "details": str(e)}), 500
+        if status != 'duplicate':
+            view_cache.clear()
+            rebuild_after_write(config_module)
+            localize_icons(config_module, [(link_id, icon, url)])
+        body, code = link_response(link_id, status)
+        return jsonify(body), code
+
+    @app.route('/api/addlinks', methods=['POST'])
+    def api_addlinks():
+        """API en bloc: delega al servei addlink o escriu directament a la BD"""
+        data = request.get_json(silent=True)
+        if not isinstance(data, list) or not data:
+            return jsonify({"error": "S'esperava una llista JSON d'enllaços"}), 400
+        on_conflict = conflict_policy(config_module, request.args.get('on_conflict'))
+        if on_conflict is None:
+            return jsonify({"error": "on_conflict ha de ser ignore, update o error"}), 400
+
+        if addlink_service and addlink_service.is_running():
+            result = addlink_service.add_links_via_api(data, on_conflict)
+            if result['success']:
+                view_cache.clear()
+                return jsonify(result['data']), result['status']
+            elif not result.get('unavailable'):
+                return jsonify({"error": result['error']}), 500
+
+        # Fallback: una sola transacció directa a la BD, com el servei
+        body, status = api_add_links(config_module, data, on_conflict)
+        if body.get("inserted"):
+            view_cache.clear()
+        return jsonify(body), status
 
     @app.route('/service/status')
     def service_status():
         """Estat del servei addlink"""
-        status = {
-            "addlink_service": {
+        if addlink_service:
+            service = {
                 "running": addlink_service.is_running(),
-                "url": addlink_service.base_url
+                "url": addlink_service.address,
+                "connections": addlink_service.connection_stats(),
+                "health": addlink_service.health_stats()
             }
+        else:
+            service = {"running": False}
+        status = {
+            "addlink_service": service,
+            "db_pool": db_pool.stats(),
+            "db_writer": get_link_writer(config_module).stats(),
+            "view_cache": view_cache.stats(),
+            "clicks": click_counter.stats(),
+            "previews": previews.stats(),
+            "types": type_cache.stats()
         }
         return jsonify(status)
     
+    # Compila ara les pàgines: la primera petició de cada worker no paga la compilació
+    templating.warm_up(app)
+    
     return app
 
 def main():
@@ -398,6 +891,10 @@ def main():
                        help='Executa en mode debug')
     parser.add_argument('--no-addlink-service', action='store_true',
                        help='No inicia el servei addlink separat')
+    parser.add_argument('--workers', type=int, default=1,
+                       help='Nombre de processos worker que comparteixen el socket (per defecte: 1)')
+    parser.add_argument('--asgi', action='store_true',
+                       help='Serveix l\'API JSON amb asyncio (uvicorn); la resta de rutes passen a Flask')
     
     args = parser.parse_args()
     
@@ -412,7 +909,15 @@ def main():
             addlink_service = AddLinkService(
                 args.config,
                 args.addlink_host,
-                args.addlink_port
+                args.addlink_port,
+                pool_size=getattr(config, 'addlink_pool_size', 10),
+                connect_timeout=getattr(config, 'addlink_connect_timeout', 2),
+                read_timeout=getattr(config, 'addlink_read_timeout', 10),
+                failure_threshold=getattr(config, 'addlink_failure_threshold', 3),
+                reset_timeout=getattr(config, 'addlink_reset_timeout', 10),
+                transport=getattr(config, 'addlink_transport', 'tcp'),
+                socket_path=getattr(config, 'addlink_socket', 'addlink.sock'),
+                config_module=config
             )
             
             # Inicia el servei addlink
@@ -424,16 +929,62 @@ def main():
             # Registra la funció per aturar el servei en sortir
             if addlink_service:
                 atexit.register(addlink_service.stop)
+                # SIGTERM surt amb SystemExit perquè atexit aturi el procés addlink
+                signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        
+        health_interval = getattr(config, 'addlink_health_interval', 5)
+        
+        # Comprovació periòdica d'enllaços morts. Amb workers va en un procés
+        # propi: el pare fa fork (i respawn) i no ha de tenir fils vius
+        linkcheck_interval = getattr(config, 'linkcheck_interval', 0)
+        if linkcheck_interval:
+            if args.workers > 1:
+                from linkcheck import spawn_job
+                linkcheck_process = spawn_job(args.config, linkcheck_interval)
+                atexit.register(linkcheck_process.terminate)
+            else:
+                from linkcheck import LinkCheckJob
+                LinkCheckJob(config, linkcheck_interval).start()
+        
+        if args.workers > 1:
+            # Mode prefork: el pare gestiona el servei addlink i els workers;
+            # cada worker crea la seva aplicació (i el seu monitor) després del fork
+            from prefork import PreforkServer
+            
+            def make_worker_app():
+                if addlink_service:
+                    addlink_service.after_fork(health_interval)
+                app = create_app(config, addlink_service)
+                if not args.asgi:
+                    return app
+                from asyncapi import AsyncApi, wsgi_fallback
+                return AsyncApi(config, addlink_service, fallback=wsgi_fallback(app),
+                                template_dir=app.template_folder)
+            
+            from clicks import flush_all
+            PreforkServer(make_worker_app, args.host, args.port, args.workers,
+                          graceful_timeout=getattr(config, 'worker_graceful_timeout', 30),
+                          asgi=args.asgi, on_worker_exit=flush_all).run()
+            return
+        
+        if addlink_service:
+            addlink_service.start_monitor(health_interval)
         
         # Crea l'aplicació principal
         app = create_app(config, addlink_service)
         
         print(f"Iniciant aplicació principal a {args.host}:{args.port}")
         if addlink_service and addlink_service.is_running():
-            print(f"Servei addlink disponible a {addlink_service.base_url}")
+            print(f"Servei addlink disponible a {addlink_service.address}")
         
         # Executa l'aplicació principal
-        app.run(host=args.host, port=args.port, debug=args.debug)
+        if args.asgi:
+            from asyncapi import AsyncApi, serve, wsgi_fallback
+            api = AsyncApi(config, addlink_service, fallback=wsgi_fallback(app),
+                           template_dir=app.template_folder)
+            serve(api, args.host, args.port)
+        else:
+            app.run(host=args.host, port=args.port, debug=args.debug)
         
     except FileNotFoundError as e:
         print(f"Error: {e}")
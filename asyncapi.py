@@ -0,0 +1,392 @@
+"""
+Mode de servei asíncron (ASGI) per a l'API JSON d'app.py i addlink.py
+- /api/links, /api/search, /api/addlink, /api/addlinks i /health s'atenen a l'event loop
+- la feina de SQLite va a un executor de mida fixa (async_db_workers)
+- les altes esperen el Future de l'escriptor amb group commit sense ocupar cap fil
+- les crides al servei addlink van al seu propi executor (addlink_pool_size)
+La resta de rutes es passen a l'aplicació Flask si hi ha adaptador WSGI.
+Necessita uvicorn (opcional): pip install uvicorn
+"""
+
+import os
+import json
+import queue
+import socket
+import asyncio
+import hashlib
+import logging
+from datetime import datetime
+from urllib.parse import parse_qs, urlencode
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.http import is_resource_modified, quote_etag
+from sqlite3 import Error
+from dbtools import get_pool, validate_link, DuplicateLinkError, get_links_page, MAX_LINKS_LIMIT, get_change_token, search_links, MAX_SEARCH_LIMIT, \
+    parse_fields, to_columnar, DEFAULT_LINK_FIELDS
+from staticsite import rebuild_after_write, templates_fingerprint
+from addlink import conflict_policy, link_response, get_link_writer, api_add_links
+from icons import localize_icons
+
+try:
+    import uvicorn
+except ImportError:
+    uvicorn = None
+
+# Mida màxima del cos d'una petició POST
+MAX_BODY_SIZE = 16 * 1024 * 1024
+
+class AsyncApi:
+    """
+    Aplicació ASGI amb l'API JSON.
+    Amb addlink_service (app.py) delega les altes al servei i escriu
+    directament a la BD si no respon; sense (addlink.py) escriu sempre a la BD.
+    """
+
+    def __init__(self, config_module, addlink_service=None, fallback=None, template_dir=None):
+        self.config_module = config_module
+        self.addlink_service = addlink_service
+        self.fallback = fallback
+        self.db_workers = getattr(config_module, 'async_db_workers', 4)
+        self.db_executor = ThreadPoolExecutor(self.db_workers, thread_name_prefix='async-db')
+        self.service_executor = ThreadPoolExecutor(getattr(config_module, 'addlink_pool_size', 10),
+                                                   thread_name_prefix='async-addlink')
+        # Un fil de l'executor = una connexió del pool
+        self.db_pool = get_pool(
+            config_module.dbpath,
+            max_size=max(getattr(config_module, 'db_pool_size', 8), self.db_workers),
+            idle_timeout=getattr(config_module, 'db_idle_timeout', 300.0)
+        )
+        # Segons que una alta espera l'escriptor abans de respondre 503
+        self.write_timeout = getattr(config_module, 'async_write_timeout', 30)
+        # Mateixa empremta que app.py: els ETag coincideixen en tots dos modes
+        self.templates_fp = templates_fingerprint(template_dir) if template_dir else ''
+        self.routes = {
+            ('GET', '/api/links'): self.api_links,
+            ('GET', '/api/search'): self.api_search,
+            ('POST', '/api/addlink'): self.api_addlink,
+            ('POST', '/api/addlinks'): self.api_addlinks,
+            ('GET', '/health'): self.health,
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        handler = self.routes.get((scope['method'], scope['path']))
+        if handler is None:
+            if self.fallback is not None:
+                await self.fallback(scope, receive, send)
+            elif any(path == scope['path'] for _, path in self.routes):
+                await _send_json(send, 405, {"error": "Mètode no permès"})
+            else:
+                await _send_json(send, 404, {"error": "Ruta no trobada"})
+            return
+
+        body = b''
+        if scope['method'] == 'POST':
+            body = await _read_body(receive)
+            if body is None:
+                await _send_json(send, 413, {"error": "Cos de la petició massa gran"})
+                return
+
+        try:
+            status, payload, headers = await handler(scope, body)
+        except Exception as e:
+            logging.error(f"Error en l'API asíncrona: {e}")
+            status, payload, headers = 500, {"error": "Error processant la sol·licitud", "details": str(e)}, {}
+        await _send_json(send, status, payload, headers)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.db_executor.shutdown(wait=False)
+                self.service_executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _run(self, executor, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+
+    def _read_links(self, scope, order, limit, after, type_id, fields=None):
+        """
+        :return: (capçaleres, enllaços, cursor); enllaços None si el client
+                 ja té la versió actual (304 sense llegir la taula links)
+        """
+        with self.db_pool.connection() as conn:
+            if not conn:
+                return None
+            headers, modified = self._validators(scope, get_change_token(conn)[0])
+            if not modified:
+                return headers, None, None
+            links, next_cursor = get_links_page(conn, order=order, limit=limit, after=after, type_id=type_id,
+                                                fields=fields)
+            return headers, links, next_cursor
+
+    async def api_links(self, scope, body):
+        args = parse_qs(scope['query_string'].decode('latin-1'))
+        order = _arg(args, 'order', 'desc')
+        after = _arg(args, 'after')
+        try:
+            limit = max(1, min(int(_arg(args, 'limit', 10)), MAX_LINKS_LIMIT))
+        except ValueError:
+            return 400, {"error": "El paràmetre limit ha de ser un enter"}, {}
+        try:
+            type_id = int(_arg(args, 'type'))
+        except (TypeError, ValueError):
+            type_id = None
+        fmt = _arg(args, 'format')
+        if fmt not in (None, 'rows', 'columnar'):
+            return 400, {"error": "Format no suportat (rows o columnar)"}, {}
+        try:
+            fields = parse_fields(_arg(args, 'fields'))
+        except ValueError as e:
+            return 400, {"error": str(e)}, {}
+
+        try:
+            result = await self._run(self.db_executor, self._read_links, scope, order, limit, after, type_id,
+                                     fields)
+        except ValueError as e:
+            return 400, {"error": str(e)}, {}
+        if result is None:
+            return 500, {"error": "Unable to establish a connection to the database."}, {}
+        headers, links, next_cursor = result
+        if links is None:
+            return 304, None, headers
+        _add_next_link(scope, headers, next_cursor, {'order': order, 'limit': limit, 'type': type_id,
+                                                     'fields': _arg(args, 'fields'), 'format': fmt})
+        if fmt == 'columnar':
+            return 200, to_columnar(fields or DEFAULT_LINK_FIELDS, links), headers
+        return 200, links, headers
+
+    def _search(self, scope, q, limit, after, prefix):
+        """Com _read_links: enllaços None vol dir 304"""
+        with self.db_pool.connection() as conn:
+            if not conn:
+                return None
+            headers, modified = self._validators(scope, get_change_token(conn)[0])
+            if not modified:
+                return headers, None, None
+            links, next_cursor = search_links(conn, q, limit=limit, after=after, prefix=prefix)
+            return headers, links, next_cursor
+
+    async def api_search(self, scope, body):
+        args = parse_qs(scope['query_string'].decode('latin-1'))
+        q = _arg(args, 'q', '')
+        mode = _arg(args, 'mode')
+        after = _arg(args, 'after')
+        try:
+            limit = max(1, min(int(_arg(args, 'limit', 10)), MAX_SEARCH_LIMIT))
+        except ValueError:
+            return 400, {"error": "El paràmetre limit ha de ser un enter"}, {}
+
+        try:
+            result = await self._run(self.db_executor, self._search, scope, q, limit, after, mode == 'prefix')
+        except ValueError as e:
+            return 400, {"error": str(e)}, {}
+        except Error as e:
+            return 503, {"error": "Cerca no disponible", "details": str(e)}, {}
+        if result is None:
+            return 500, {"error": "Unable to establish a connection to the database."}, {}
+        headers, links, next_cursor = result
+        if links is None:
+            return 304, None, headers
+        _add_next_link(scope, headers, next_cursor, {'q': q, 'mode': mode, 'limit': limit})
+        return 200, links, headers
+
+    def _validators(self, scope, version):
+        """ETag com el decorador conditional d'app.py (sense Last-Modified)"""
+        full_path = f"{scope['path']}?{scope['query_string'].decode('latin-1')}"
+        etag = hashlib.sha1(f"{self.templates_fp}:{version}:{full_path}".encode()).hexdigest()[:20]
+        headers = {
+            'ETag': quote_etag(etag),
+            'Cache-Control': 'no-cache'
+        }
+        return headers, is_resource_modified(_environ(scope), etag=etag)
+
+    def _delegate(self, method, *args):
+        """Crida el servei addlink si està actiu; None si cal escriure directament"""
+        if self.addlink_service and self.addlink_service.is_running():
+            result = getattr(self.addlink_service, method)(*args)
+            if result['success'] or not result.get('unavailable'):
+                return result
+        return None
+
+    async def api_addlink(self, scope, body):
+        data = _loads(body)
+        if not data:
+            return 400, {"error": "No s'han rebut dades JSON"}, {}
+
+        link, error = validate_link(data)
+        if error:
+            return 400, {"error": error}, {}
+        description, url, type_id, icon = link
+        on_conflict = conflict_policy(self.config_module, data.get('on_conflict'))
+        if on_conflict is None:
+            return 400, {"error": "on_conflict ha de ser ignore, update o error"}, {}
+
+        if self.addlink_service:
+            result = await self._run(self.service_executor, self._delegate, 'add_link_via_api',
+                                     description, url, type_id, icon, on_conflict)
+            if result is not None:
+                if result['success']:
+                    return result['status'], result['data'], {}
+                error = result['error'] if isinstance(result['error'], dict) else {"error": result['error']}
+                return result.get('status', 500), error, {}
+
+        # Escriptura directa: s'espera el Future de l'escriptor, sense bloquejar cap fil
+        try:
+            future = get_link_writer(self.config_module).submit((datetime.now(), description, url, type_id, icon),
+                                           timeout=0, on_conflict=on_conflict)
+        except queue.Full:
+            return 503, {"error": "Massa escriptures pendents, torna-ho a provar"}, {}
+        try:
+            link_id, status = await asyncio.wait_for(asyncio.wrap_future(future), self.write_timeout)
+        except DuplicateLinkError as e:
+            return 409, {"error": "L'enllaç ja existeix", "id": e.link_id}, {}
+        except asyncio.TimeoutError:
+            # El Future queda cancel·lat: si encara era a la cua, l'escriptor el descarta
+            return 503, {"error": "L'escriptura no ha acabat a temps, torna-ho a provar"}, {}
+        if status != 'duplicate':
+            await self._run(self.db_executor, rebuild_after_write, self.config_module)
+            localize_icons(self.config_module, [(link_id, icon, url)])
+        body, code = link_response(link_id, status)
+        return code, body, {}
+
+    async def api_addlinks(self, scope, body):
+        data = _loads(body)
+        if not isinstance(data, list) or not data:
+            return 400, {"error": "S'esperava una llista JSON d'enllaços"}, {}
+        args = parse_qs(scope['query_string'].decode('latin-1'))
+        on_conflict = conflict_policy(self.config_module, _arg(args, 'on_conflict'))
+        if on_conflict is None:
+            return 400, {"error": "on_conflict ha de ser ignore, update o error"}, {}
+
+        if self.addlink_service:
+            result = await self._run(self.service_executor, self._delegate, 'add_links_via_api',
+                                     data, on_conflict)
+            if result is not None:
+                if result['success']:
+                    return result['status'], result['data'], {}
+                return 500, {"error": result['error']}, {}
+
+        # Mateixa alta en bloc que el servei addlink, a l'executor de la BD
+        body, status = await self._run(self.db_executor, api_add_links, self.config_module, data, on_conflict)
+        return status, body, {}
+
+    def _check_db(self):
+        with self.db_pool.connection() as conn:
+            if not conn:
+                return False
+            conn.execute("SELECT 1")
+            return True
+
+    async def health(self, scope, body):
+        try:
+            connected = await self._run(self.db_executor, self._check_db)
+        except Exception as e:
+            return 503, {"status": "unhealthy", "error": str(e)}, {}
+        if not connected:
+            return 503, {"status": "unhealthy", "database": "disconnected"}, {}
+        return 200, {"status": "healthy", "database": "connected", "writer": get_link_writer(self.config_module).stats()}, {}
+
+def _add_next_link(scope, headers, next_cursor, query):
+    """Capçaleres X-Next-Cursor i Link de la pàgina següent"""
+    if not next_cursor:
+        return
+    query = dict(query, after=next_cursor)
+    next_url = f"{scope.get('root_path', '')}{scope['path']}?" + \
+        urlencode({k: v for k, v in query.items() if v is not None})
+    headers['X-Next-Cursor'] = next_cursor
+    headers['Link'] = f'<{next_url}>; rel="next"'
+
+def _arg(args, name, default=None):
+    values = args.get(name)
+    return values[0] if values else default
+
+def _loads(body):
+    try:
+        return json.loads(body.decode('utf-8')) if body else None
+    except ValueError:
+        return None
+
+def _environ(scope):
+    """Capçaleres condicionals en format WSGI per a is_resource_modified"""
+    environ = {'REQUEST_METHOD': scope['method']}
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        if name in ('IF_NONE_MATCH', 'IF_MODIFIED_SINCE', 'IF_MATCH', 'IF_RANGE', 'RANGE'):
+            environ[f'HTTP_{name}'] = value.decode('latin-1')
+    return environ
+
+async def _read_body(receive):
+    """Llegeix el cos sencer; None si supera MAX_BODY_SIZE"""
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if size > MAX_BODY_SIZE:
+            return None
+        chunks.append(chunk)
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+async def _send_json(send, status, payload, headers=None):
+    body = b'' if payload is None else \
+        (json.dumps(payload, separators=(',', ':'), sort_keys=True) + '\n').encode('utf-8')
+    raw_headers = [(b'content-length', str(len(body)).encode())]
+    if payload is not None:
+        raw_headers.append((b'content-type', b'application/json'))
+    for name, value in (headers or {}).items():
+        raw_headers.append((name.lower().encode('latin-1'), str(value).encode('latin-1')))
+    await send({'type': 'http.response.start', 'status': status, 'headers': raw_headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+def wsgi_fallback(wsgi_app):
+    """
+    Adapta l'aplicació Flask perquè atengui les rutes que no són de l'API.
+    Retorna None si no hi ha cap adaptador WSGI instal·lat.
+    """
+    try:
+        from a2wsgi import WSGIMiddleware
+    except ImportError:
+        try:
+            from uvicorn.middleware.wsgi import WSGIMiddleware
+        except ImportError:
+            return None
+    return WSGIMiddleware(wsgi_app)
+
+def serve(asgi_app, host, port, ready_fd=None, backlog=2048, sock=None):
+    """
+    Serveix l'aplicació ASGI amb uvicorn.
+    El socket s'obre aquí perquè ready_fd s'avisi un cop ja s'escolta
+    (host 'unix://<ruta>' escolta en un socket Unix, com make_server);
+    un worker prefork passa el socket heretat a sock.
+    """
+    if uvicorn is None:
+        raise RuntimeError("El mode asíncron necessita uvicorn (pip install uvicorn)")
+
+    if sock is not None:
+        pass
+    elif host.startswith('unix://'):
+        socket_path = host[len('unix://'):]
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(socket_path)
+        sock.listen(backlog)
+    else:
+        sock = socket.create_server((host, port), backlog=backlog)
+
+    if ready_fd is not None:
+        os.write(ready_fd, b'ready\n')
+        os.close(ready_fd)
+
+    config = uvicorn.Config(asgi_app, lifespan='on', log_level='warning', backlog=backlog)
+    uvicorn.Server(config).run(sockets=[sock])
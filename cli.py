@@ -3,6 +3,11 @@ from datetime import datetime
 import sys
 import logging
 from dbtools import create_connection, add_link, interactive
+from staticsite import rebuild_after_write
+from importer import DEFAULT_CHUNK_SIZE, detect_format, import_links, read_checkpoint
+from linkcheck import check_links
+from icons import BulkLocalizer, get_icon_store, localize_icons
+import config
 from config import dbpath, log
 
 def setup_logging(log_mode):
@@ -20,6 +25,48 @@ def setup_logging(log_mode):
 
     logging.getLogger().setLevel(logging.INFO)
 
+def positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
+
+def run_import(dbc, args) -> None:
+    """
+    import mode
+    """
+    fmt = args.format or detect_format(args.import_file)
+    checkpoint = None if args.import_file == '-' else f"{args.import_file}.progress"
+    start_line = args.resume_from or (read_checkpoint(checkpoint) if args.resume else 0)
+    if start_line:
+        logging.info(f"Resuming import after line {start_line}")
+
+    # Icons are opt-in: each one is an outbound fetch, fed chunk by chunk
+    localizer = BulkLocalizer(config) if args.icons and get_icon_store(config) else None
+    stream = sys.stdin if args.import_file == '-' else open(args.import_file, 'r', newline='', encoding='utf-8')
+    try:
+        stats = import_links(dbc, stream, fmt, chunk_size=args.chunk_size,
+                             start_line=start_line, checkpoint=checkpoint, on_conflict=args.on_conflict,
+                             on_written=localizer.add if localizer else None)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+        if localizer:
+            # main() rebuilds the static site once, after the import
+            updated, tried = localizer.close(rebuild=False)
+            logging.info(f"Icons stored locally: {updated} of {tried}")
+    logging.info(f"Import finished: {stats['inserted']} inserted, {stats['duplicates']} duplicates, "
+                 f"{stats['failed']} failed, last line {stats['last_line']}")
+
+def localize_new_icon(link_id: int, args) -> None:
+    """
+    store the icon of the new link locally, as the web and API paths do
+    """
+    # The process exits right after, so wait for the background fetch
+    future = localize_icons(config, [(link_id, args.icon, args.url)])
+    if future:
+        future.result()
+
 def main() -> None:
     """
     main function
@@ -30,14 +77,33 @@ def main() -> None:
     parser.add_argument('-t', '--type_id', type=int, help='Link type ID')
     parser.add_argument('-i', '--icon', type=str, help='Link icon')
     parser.add_argument('-l', '--log', type=str, choices=['screen', 'file', 'all'], default=log, help='Logging mode')
+    parser.add_argument('--import', dest='import_file', type=str, help='Import links from a CSV or JSONL file (- for stdin)')
+    parser.add_argument('--format', type=str, choices=['csv', 'jsonl'], help='Import format (default: from the file extension)')
+    parser.add_argument('--chunk-size', type=positive_int, default=DEFAULT_CHUNK_SIZE, help='Rows per import transaction')
+    parser.add_argument('--resume', action='store_true', help='Resume an import from its checkpoint file')
+    parser.add_argument('--resume-from', type=int, default=0, help='Skip input lines up to this line number')
+    parser.add_argument('--on-conflict', type=str, choices=['ignore', 'update', 'error'], default='ignore',
+                        help='What to do with URLs already stored (default: ignore)')
+    parser.add_argument('--check-links', action='store_true', help='Check which links are still alive')
+    parser.add_argument('--icons', action='store_true',
+                        help='Also store the icons of the imported links locally (one fetch per link)')
     args = parser.parse_args()
 
     setup_logging(args.log)
 
     dbc = create_connection(dbpath)
     if dbc:
-        if args.description and args.url:
-            interactive(dbc, args.description, args.url, args.type_id, args.icon)
+        if args.import_file:
+            run_import(dbc, args)
+            rebuild_after_write(config)
+        elif args.check_links:
+            result = check_links(config)
+            logging.info(f"Link check finished: {result['checked']} checked, {result['dead']} dead, "
+                         f"{result['seconds']} s")
+        elif args.description and args.url:
+            link_id = interactive(dbc, args.description, args.url, args.type_id, args.icon)
+            rebuild_after_write(config)
+            localize_new_icon(link_id, args)
         else:
             logging.error("Please provide at least a description and a URL.")
             sys.exit(1)
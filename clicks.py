@@ -0,0 +1,117 @@
+import atexit
+import logging
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Optional
+
+from cache import LRUCache
+from dbtools import get_pool, get_link_url, record_clicks
+
+_counters = []
+
+class ClickCounter:
+    """
+    Click counts for the /go/<id> redirect, kept in memory.
+    Target URLs come from an LRU map (one indexed read on a miss), clicks
+    are summed per link and a background thread adds them to the clicks
+    table every flush_interval seconds in a single transaction, so a
+    redirect never writes to SQLite.
+    """
+
+    def __init__(self, db_file: str, flush_interval: float = 5.0, url_cache_size: int = 10000):
+        self.db_file = db_file
+        self.flush_interval = flush_interval
+        self.urls = LRUCache(url_cache_size)
+        self._counts: Counter = Counter()
+        self._last_click: Dict[int, str] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self.flushes = 0
+        self.flushed_clicks = 0
+        self.last_flush_ms: Optional[float] = None
+        self._thread = threading.Thread(target=self._run, name='click-flush', daemon=True)
+        self._thread.start()
+        _counters.append(self)
+
+    def resolve(self, link_id: int) -> Optional[str]:
+        """
+        Target URL of a link
+        :return: URL or None if the link does not exist
+        """
+        url = self.urls.get(link_id)
+        if url is None:
+            with get_pool(self.db_file).connection() as conn:
+                url = get_link_url(conn, link_id) if conn else None
+            if url is not None:
+                self.urls.set(link_id, url)
+        return url
+
+    def hit(self, link_id: int) -> None:
+        """Count one click"""
+        now = datetime.now().isoformat(sep=' ', timespec='seconds')
+        with self._lock:
+            self._counts[link_id] += 1
+            self._last_click[link_id] = now
+
+    def pending(self) -> int:
+        with self._lock:
+            return sum(self._counts.values())
+
+    def flush(self) -> int:
+        """
+        Write the buffered counts to the clicks table
+        :return: Number of clicks written
+        """
+        with self._flush_lock:
+            with self._lock:
+                counts, self._counts = self._counts, Counter()
+                last_click, self._last_click = self._last_click, {}
+            if not counts:
+                return 0
+            started = time.monotonic()
+            try:
+                with get_pool(self.db_file).connection() as conn:
+                    if not conn:
+                        raise RuntimeError(f"Unable to open database {self.db_file}")
+                    record_clicks(conn, {link_id: (count, last_click[link_id]) for link_id, count in counts.items()})
+            except Exception as e:
+                # Keep the clicks for the next flush
+                logging.error(f"Error flushing clicks: {e}")
+                with self._lock:
+                    self._counts.update(counts)
+                    for link_id, when in last_click.items():
+                        self._last_click.setdefault(link_id, when)
+                return 0
+            total = sum(counts.values())
+            self.flushes += 1
+            self.flushed_clicks += total
+            self.last_flush_ms = round((time.monotonic() - started) * 1000, 2)
+            return total
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def close(self) -> None:
+        """Stop the flush thread and write what is left"""
+        self._stop.set()
+        self.flush()
+
+    def stats(self) -> Dict:
+        return {
+            "pending": self.pending(),
+            "flushes": self.flushes,
+            "flushed_clicks": self.flushed_clicks,
+            "last_flush_ms": self.last_flush_ms,
+            "urls": self.urls.stats()
+        }
+
+def flush_all() -> None:
+    """Flush every counter of this process (for workers that skip atexit)"""
+    for counter in _counters:
+        counter.close()
+
+atexit.register(flush_all)
@@ -1,75 +1,919 @@
 import sqlite3
+import json
+import re
+import base64
+import binascii
 from sqlite3 import Error
-from datetime import datetime
-from os import path
+from datetime import datetime, timezone
+from os import path, makedirs, getpid
+import hashlib
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+import queue
+from concurrent.futures import Future
 import logging
-from typing import Optional, Tuple, List
+import threading
+import time
+from contextlib import contextmanager
+from collections import deque
+from typing import Optional, Tuple, List, Dict, Iterable, Iterator, Set, Sequence, Deque
 
-def create_connection(db_file: str) -> Optional[sqlite3.Connection]:
+# Performance pragmas applied to every connection at open time.
+# WAL lets readers keep going while addlink.py (a separate process) writes.
+PRAGMAS = [
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+    ("busy_timeout", 5000),
+    ("cache_size", -16000),        # ~16 MB page cache
+    ("mmap_size", 268435456),      # 256 MB memory-mapped I/O
+    ("temp_store", "MEMORY"),
+]
+
+def has_fts5(conn: sqlite3.Connection) -> bool:
+    """
+    Check whether this SQLite build has the FTS5 extension
+    :param conn: Database connection
+    """
+    try:
+        conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS temp.fts5_probe USING fts5(x)")
+        conn.execute("DROP TABLE temp.fts5_probe")
+        return True
+    except Error:
+        return False
+
+def has_search_index(conn: sqlite3.Connection) -> bool:
+    """
+    Check whether the links_fts search index exists (migration 4)
+    :param conn: Database connection
+    """
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'links_fts'").fetchone() is not None
+
+# Ports dropped by normalize_url because they are the scheme's default
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+def normalize_url(url: str) -> str:
+    """
+    Canonical form of a URL used to detect duplicates: scheme and host in
+    lower case, default port and fragment dropped, empty path as '/' and
+    query parameters sorted. Anything that is not an absolute URL is only
+    stripped of surrounding whitespace.
+    :param url: URL as entered
+    :return: Normalized URL
+    """
+    url = url.strip()
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return url
+    if not parts.scheme or not parts.netloc:
+        return url
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if ':' in host:
+        host = f"[{host}]"
+    if parts.username or parts.password:
+        host = parts.netloc.rsplit('@', 1)[0] + '@' + host
+    if port is not None and port != DEFAULT_PORTS.get(scheme):
+        host += f":{port}"
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, host, parts.path or '/', query, ''))
+
+def url_hash(url: str) -> str:
+    """
+    Key of the unique index on links.url_hash
+    :param url: URL as entered
+    :return: SHA-1 hex digest of the normalized URL
+    """
+    return hashlib.sha1(normalize_url(url).encode('utf-8')).hexdigest()
+
+def _migrate_url_hash(conn: sqlite3.Connection) -> None:
+    """
+    Add links.url_hash, backfill it and index it as unique. Rows whose URL
+    already exists with a lower id keep a NULL hash: they stay visible but
+    are left out of the index, so the migration never deletes data.
+    """
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(links)")]
+    if 'url_hash' not in columns:
+        conn.execute("ALTER TABLE links ADD COLUMN url_hash TEXT")
+    seen = {row[0] for row in conn.execute("SELECT url_hash FROM links WHERE url_hash IS NOT NULL")}
+    updates = []
+    for link_id, url in conn.execute("SELECT id, url FROM links WHERE url_hash IS NULL ORDER BY id"):
+        key = url_hash(url or '')
+        if key not in seen:
+            seen.add(key)
+            updates.append((key, link_id))
+    conn.executemany("UPDATE links SET url_hash = ? WHERE id = ?", updates)
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_links_url_hash ON links (url_hash)")
+
+def _migrate_type_version(conn: sqlite3.Connection) -> None:
+    """
+    Add change_log.type_version, bumped only by changes to the type table,
+    so TypeCache can stay valid while links are being written
+    """
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(change_log)")]
+    if 'type_version' not in columns:
+        conn.execute("ALTER TABLE change_log ADD COLUMN type_version INTEGER NOT NULL DEFAULT 0")
+    for event in ('insert', 'update', 'delete'):
+        conn.execute(f"DROP TRIGGER IF EXISTS type_change_{event}")
+        conn.execute(f"""
+            CREATE TRIGGER type_change_{event} AFTER {event.upper()} ON type BEGIN
+                UPDATE change_log SET version = version + 1, type_version = type_version + 1,
+                                      modified = datetime('now') WHERE id = 1;
+            END""")
+
+# Numbered schema migrations, tracked with PRAGMA user_version.
+# Each one runs in its own transaction and must be idempotent, since a
+# database created from base.sql before migrations existed starts at 0.
+# An optional third element is a check run first; when it fails the
+# migration is skipped (and logged) instead of breaking every connection.
+# A fourth element tells whether the migration's schema exists: a skipped
+# migration is applied on a later start once its check passes (e.g. after
+# SQLite gains FTS5), since user_version has already moved past it.
+# A migration can also be a function of the connection, for data changes
+# that need Python; it runs inside the same kind of transaction.
+MIGRATIONS = [
+    (1, """
+        CREATE TABLE IF NOT EXISTS links (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT (23),
+            description TEXT,
+            url TEXT,
+            icon TEXT,
+            type INTEGER REFERENCES type (id) ON UPDATE CASCADE
+        );
+        CREATE TABLE IF NOT EXISTS type (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            descripcion TEXT
+        );
+        INSERT OR IGNORE INTO type (id, descripcion) VALUES (1, 'Fixed');
+        INSERT OR IGNORE INTO type (id, descripcion) VALUES (2, 'Dynamic');
+        INSERT OR IGNORE INTO type (id, descripcion) VALUES (3, 'Highlighted');
+    """),
+    # Indexes backing the date-ordered keyset pagination in get_links.
+    # id is the rowid, so both indexes already cover ORDER BY date, id.
+    (2, """
+        CREATE INDEX IF NOT EXISTS idx_links_date ON links (date);
+        CREATE INDEX IF NOT EXISTS idx_links_type_date ON links (type, date);
+    """),
+    # Single-row write counter bumped by triggers on every change to links
+    # or type. It is a cheap change token for ETag / Last-Modified.
+    (3, """
+        CREATE TABLE IF NOT EXISTS change_log (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL,
+            modified TEXT NOT NULL
+        );
+        INSERT OR IGNORE INTO change_log (id, version, modified) VALUES (1, 0, datetime('now'));
+        CREATE TRIGGER IF NOT EXISTS links_change_insert AFTER INSERT ON links BEGIN
+            UPDATE change_log SET version = version + 1, modified = datetime('now') WHERE id = 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS links_change_update AFTER UPDATE ON links BEGIN
+            UPDATE change_log SET version = version + 1, modified = datetime('now') WHERE id = 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS links_change_delete AFTER DELETE ON links BEGIN
+            UPDATE change_log SET version = version + 1, modified = datetime('now') WHERE id = 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS type_change_insert AFTER INSERT ON type BEGIN
+            UPDATE change_log SET version = version + 1, modified = datetime('now') WHERE id = 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS type_change_update AFTER UPDATE ON type BEGIN
+            UPDATE change_log SET version = version + 1, modified = datetime('now') WHERE id = 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS type_change_delete AFTER DELETE ON type BEGIN
+            UPDATE change_log SET version = version + 1, modified = datetime('now') WHERE id = 1;
+        END;
+    """),
+    # Full-text index over description and url for search_links. It is an
+    # external-content table: the text lives only in links, and triggers keep
+    # the index in sync. prefix='2 3' makes autocomplete prefix queries fast.
+    (4, """
+        CREATE VIRTUAL TABLE IF NOT EXISTS links_fts USING fts5 (
+            description, url,
+            content='links', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        );
+        CREATE TRIGGER IF NOT EXISTS links_fts_insert AFTER INSERT ON links BEGIN
+            INSERT INTO links_fts (rowid, description, url) VALUES (new.id, new.description, new.url);
+        END;
+        CREATE TRIGGER IF NOT EXISTS links_fts_delete AFTER DELETE ON links BEGIN
+            INSERT INTO links_fts (links_fts, rowid, description, url) VALUES ('delete', old.id, old.description, old.url);
+        END;
+        CREATE TRIGGER IF NOT EXISTS links_fts_update AFTER UPDATE OF description, url ON links BEGIN
+            INSERT INTO links_fts (links_fts, rowid, description, url) VALUES ('delete', old.id, old.description, old.url);
+            INSERT INTO links_fts (rowid, description, url) VALUES (new.id, new.description, new.url);
+        END;
+        INSERT INTO links_fts (links_fts) VALUES ('rebuild');
+    """, has_fts5, has_search_index),
+    # Normalized URL hash with a unique index: a duplicate check is one
+    # index probe (see insert_link)
+    (5, _migrate_url_hash),
+    # Click counts for /go/<id>, written in batches by clicks.ClickCounter.
+    # No change_log trigger: clicks do not change any rendered page.
+    (6, """
+        CREATE TABLE IF NOT EXISTS clicks (
+            link_id INTEGER PRIMARY KEY REFERENCES links (id) ON DELETE CASCADE,
+            count INTEGER NOT NULL DEFAULT 0,
+            last_click TEXT
+        );
+    """),
+    # Results of linkcheck.py. dead is set after several failed checks in a
+    # row; only changes of dead bump change_log, since /view flags or hides
+    # dead links and nothing else of this table is rendered.
+    (7, """
+        CREATE TABLE IF NOT EXISTS link_status (
+            link_id INTEGER PRIMARY KEY REFERENCES links (id) ON DELETE CASCADE,
+            status INTEGER,
+            error TEXT,
+            checked TEXT NOT NULL,
+            etag TEXT,
+            last_modified TEXT,
+            failures INTEGER NOT NULL DEFAULT 0,
+            dead INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS idx_link_status_checked ON link_status (checked);
+        CREATE INDEX IF NOT EXISTS idx_link_status_dead ON link_status (link_id) WHERE dead = 1;
+        CREATE TRIGGER IF NOT EXISTS link_status_change_insert AFTER INSERT ON link_status WHEN new.dead = 1 BEGIN
+            UPDATE change_log SET version = version + 1, modified = datetime('now') WHERE id = 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS link_status_change_update AFTER UPDATE OF dead ON link_status
+        WHEN old.dead IS NOT new.dead BEGIN
+            UPDATE change_log SET version = version + 1, modified = datetime('now') WHERE id = 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS link_status_change_delete AFTER DELETE ON link_status WHEN old.dead = 1 BEGIN
+            UPDATE change_log SET version = version + 1, modified = datetime('now') WHERE id = 1;
+        END;
+    """),
+    # Page metadata fetched by preview_routes.py, fetched is a Unix time
+    # for the TTL. New or changed previews are rendered on /view, so they
+    # bump change_log like any change to links.
+    (8, """
+        CREATE TABLE IF NOT EXISTS link_previews (
+            link_id INTEGER PRIMARY KEY REFERENCES links (id) ON DELETE CASCADE,
+            url TEXT NOT NULL,
+            status INTEGER,
+            title TEXT,
+            description TEXT,
+            image TEXT,
+            fetched REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_link_previews_fetched ON link_previews (fetched);
+        CREATE TRIGGER IF NOT EXISTS link_previews_change_insert AFTER INSERT ON link_previews BEGIN
+            UPDATE change_log SET version = version + 1, modified = datetime('now') WHERE id = 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS link_previews_change_update AFTER UPDATE ON link_previews
+        WHEN old.title IS NOT new.title OR old.description IS NOT new.description OR old.image IS NOT new.image BEGIN
+            UPDATE change_log SET version = version + 1, modified = datetime('now') WHERE id = 1;
+        END;
+    """),
+    # Separate counter for the type table (see TypeCache)
+    (9, _migrate_type_version),
+]
+
+_migrated = set()
+_migrate_lock = threading.Lock()
+
+def apply_pragmas(conn: sqlite3.Connection) -> None:
+    """
+    Apply the performance pragmas to a freshly opened connection
+    :param conn: Database connection
+    """
+    for name, value in PRAGMAS:
+        conn.execute(f"PRAGMA {name} = {value}")
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """
+    Apply every pending migration
+    :param conn: Database connection
+    :return: Schema version after migrating
+    """
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for number, sql, *checks in MIGRATIONS:
+        check, applied = (checks + [None, None])[:2]
+        if number <= version:
+            # Skipped on an earlier start: apply it now if its check passes
+            if check and applied and not applied(conn) and check(conn):
+                logging.info(f"Applying skipped database migration {number}")
+                _apply_migration(conn, sql, version)
+            continue
+        if check and not check(conn):
+            logging.warning(f"Skipping database migration {number}: {check.__name__} failed")
+            conn.execute(f"PRAGMA user_version = {number}")
+            version = number
+            continue
+        logging.info(f"Applying database migration {number}")
+        _apply_migration(conn, sql, number)
+        version = number
+    return version
+
+def _apply_migration(conn: sqlite3.Connection, sql, version: int) -> None:
+    """Run one migration and set user_version in the same transaction"""
+    try:
+        if callable(sql):
+            conn.execute("BEGIN IMMEDIATE")
+            sql(conn)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        else:
+            conn.executescript(f"BEGIN IMMEDIATE; {sql}; PRAGMA user_version = {version}; COMMIT;")
+    except Error:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+
+def create_connection(db_file: str, check_same_thread: bool = True) -> Optional[sqlite3.Connection]:
     """ create a database connection to the SQLite database
-        specified by the db_file
+        specified by the db_file, creating and migrating the schema as needed
     :param db_file: database file
+    :param check_same_thread: passed to sqlite3.connect (pooled connections disable it)
     :return: Connection object or None
     """
     conn = None
     try:
         if not path.isfile(db_file):
             dbpath=path.dirname(db_file)
+            if dbpath and not path.exists(dbpath):
+                logging.info(f"Creating database directory: {dbpath}")
+                makedirs(dbpath, exist_ok=True)
             logging.info(f"Database file {db_file} does not exist. Creating new database.")
-            conn = sqlite3.connect(db_file)
-            
-            if path.isfile(f"base.sql"):
-                logging.info("Importing database schema from base.sql")
-                with open(f"base.sql", 'r') as f:
-                    sql_statements = f.read().split(';')
-                    for statement in sql_statements:
-                        if statement.strip():
-                            conn.execute(statement)
-                conn.commit()
-                logging.info("Database created successfully")
-            else:
-                logging.warning("No DB schema found. Please ensure base.sql exists in the current directory.")
-                return None
         else:
             logging.info(f"Connecting to existing database: {db_file}")
-            conn = sqlite3.connect(db_file)
+        conn = sqlite3.connect(db_file, check_same_thread=check_same_thread)
+        apply_pragmas(conn)
+
+        # The schema only needs checking once per process
+        with _migrate_lock:
+            if db_file not in _migrated:
+                migrate(conn)
+                _migrated.add(db_file)
 
     except Error as e:
         logging.error(f"Error connecting to the database: {e}")
+        if conn is not None:
+            conn.close()
         return None
 
     return conn
 
-def add_link(conn: sqlite3.Connection, task: Tuple[datetime, str, str, Optional[int], str]) -> int:
+class ConnectionPool:
+    """
+    Pool of persistent SQLite connections shared by all threads.
+    A request checks out an idle connection (the most recently used one)
+    and checks it back in when done, so servers that run every request on a
+    new thread still reuse connections. At most max_size connections are
+    pooled; when all of them are checked out a throwaway connection is used
+    instead. Connections idle for longer than idle_timeout are closed.
+    """
+
+    def __init__(self, db_file: str, max_size: int = 8, idle_timeout: float = 300.0):
+        self.db_file = db_file
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.pid = getpid()
+        self._lock = threading.Lock()
+        # Idle connections as (connection, last_used), most recently used last
+        self._idle: Deque[Tuple[sqlite3.Connection, float]] = deque()
+        # Pooled connections, idle or checked out
+        self._size = 0
+        self.opened = 0
+        self.reused = 0
+
+    def _evict(self, now: float) -> None:
+        """Close connections idle for too long (caller holds the lock)"""
+        while self._idle and now - self._idle[0][1] > self.idle_timeout:
+            conn, _ = self._idle.popleft()
+            self._size -= 1
+            conn.close()
+
+    def _acquire(self) -> Tuple[Optional[sqlite3.Connection], bool]:
+        with self._lock:
+            self._evict(time.monotonic())
+            if self._idle:
+                self.reused += 1
+                return self._idle.pop()[0], True
+            pooled = self._size < self.max_size
+            if pooled:
+                self._size += 1
+        conn = create_connection(self.db_file, check_same_thread=False)
+        with self._lock:
+            if conn is None:
+                if pooled:
+                    self._size -= 1
+                return None, False
+            self.opened += 1
+        return conn, pooled
+
+    def _release(self, conn: sqlite3.Connection, pooled: bool) -> None:
+        if not pooled:
+            conn.close()
+            return
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except Error:
+            # A connection that can't roll back is not handed out again
+            conn.close()
+            with self._lock:
+                self._size -= 1
+            return
+        with self._lock:
+            self._idle.append((conn, time.monotonic()))
+
+    @contextmanager
+    def connection(self) -> Iterator[Optional[sqlite3.Connection]]:
+        """
+        Check out a connection for the duration of the block
+        :return: Connection object or None if the database can't be opened
+        """
+        conn, pooled = self._acquire()
+        try:
+            yield conn
+        finally:
+            if conn is not None:
+                self._release(conn, pooled)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"size": self._size, "idle": len(self._idle), "max_size": self.max_size,
+                    "opened": self.opened, "reused": self.reused}
+
+    def close(self) -> None:
+        """Close every idle connection in the pool"""
+        with self._lock:
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._size -= 1
+                conn.close()
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+def get_pool(db_file: str, max_size: int = 8, idle_timeout: float = 300.0) -> ConnectionPool:
+    """
+    Return the shared connection pool for db_file, creating it on first use.
+    A forked child gets a fresh pool: SQLite connections must not cross fork().
+    :param db_file: database file
+    :param max_size: maximum number of pooled connections
+    :param idle_timeout: seconds before an unused connection is closed
+    :return: ConnectionPool
+    """
+    with _pools_lock:
+        pool = _pools.get(db_file)
+        if pool is None or pool.pid != getpid():
+            pool = _pools[db_file] = ConnectionPool(db_file, max_size, idle_timeout)
+        return pool
+
+# What to do when a link with the same normalized URL already exists:
+# ignore keeps the stored link, update overwrites its description, type and
+# icon, error raises DuplicateLinkError
+ON_CONFLICT_POLICIES = ('ignore', 'update', 'error')
+
+class DuplicateLinkError(sqlite3.IntegrityError):
+    """A link with the same normalized URL already exists"""
+
+    def __init__(self, link_id: int):
+        super().__init__(f"Link already exists with id {link_id}")
+        self.link_id = link_id
+
+def insert_link(conn: sqlite3.Connection, task: Tuple[datetime, str, str, Optional[int], str],
+                on_conflict: str = 'ignore') -> Tuple[int, str]:
+    """
+    Insert a link unless its normalized URL is already stored, without committing
+    :param conn: Database connection
+    :param task: Tuple with link data (date, description, url, type, icon)
+    :param on_conflict: ignore, update or error (see ON_CONFLICT_POLICIES)
+    :return: (link id, 'inserted' | 'duplicate' | 'updated')
+    :raises DuplicateLinkError: with on_conflict='error' if the URL exists
+    """
+    if on_conflict not in ON_CONFLICT_POLICIES:
+        raise ValueError(f"Unknown on_conflict policy: {on_conflict}")
+    date, description, url, type_id, icon = task
+    key = url_hash(url)
+    existing = conn.execute("SELECT id FROM links WHERE url_hash = ?", (key,)).fetchone()
+    if existing is None:
+        sql = ''' INSERT INTO links(date,description,url,type,icon,url_hash)
+                  VALUES(?,?,?,?,?,?) ON CONFLICT (url_hash) DO NOTHING '''
+        cur = conn.execute(sql, (date, description, url, type_id, icon, key))
+        if cur.rowcount:
+            return cur.lastrowid, 'inserted'
+        # Another connection stored the same URL between the probe and the insert
+        existing = conn.execute("SELECT id FROM links WHERE url_hash = ?", (key,)).fetchone()
+    link_id = existing[0]
+    if on_conflict == 'error':
+        raise DuplicateLinkError(link_id)
+    if on_conflict == 'update':
+        conn.execute("UPDATE links SET description = ?, type = ?, icon = ? WHERE id = ?",
+                     (description, type_id, icon, link_id))
+        return link_id, 'updated'
+    return link_id, 'duplicate'
+
+def add_link(conn: sqlite3.Connection, task: Tuple[datetime, str, str, Optional[int], str],
+             on_conflict: str = 'ignore') -> int:
     """
     Create a new task
     :param conn: Database connection
     :param task: Tuple with link data (date, description, url, type, icon)
-    :return: ID of the inserted row
+    :param on_conflict: ignore, update or error (see ON_CONFLICT_POLICIES)
+    :return: ID of the inserted (or already stored) row
     """
+    try:
+        link_id, _ = insert_link(conn, task, on_conflict)
+        conn.commit()
+    except Error:
+        conn.rollback()
+        raise
+    return link_id
 
-    sql = ''' INSERT INTO links(date,description,url,type,icon)
-              VALUES(?,?,?,?,?) '''
-    cur = conn.cursor()
-    cur.execute(sql, task)
-    conn.commit()
+MAX_BULK_LINKS = 10000
+
+# Range of an SQLite INTEGER; larger Python ints raise OverflowError on insert
+SQLITE_MIN_INT = -2 ** 63
+SQLITE_MAX_INT = 2 ** 63 - 1
 
-    return cur.lastrowid
+def validate_link(item: object) -> Tuple[Optional[Tuple[str, str, Optional[int], str]], Optional[str]]:
+    """
+    Validate one link object received as JSON
+    :param item: dict with description, url and optional type_id and icon
+    :return: ((description, url, type_id, icon), None) or (None, error message)
+    """
+    if not isinstance(item, dict):
+        return None, "Item must be a JSON object"
+    description = item.get('description')
+    url = item.get('url')
+    type_id = item.get('type_id')
+    icon = item.get('icon') or ''
+    if not isinstance(description, str) or not isinstance(url, str) or not description.strip() or not url.strip():
+        return None, "description and url are required"
+    if type_id is not None and type_id != '':
+        try:
+            type_id = int(type_id)
+        except (TypeError, ValueError):
+            return None, "type_id must be an integer"
+        if not SQLITE_MIN_INT <= type_id <= SQLITE_MAX_INT:
+            return None, "type_id is out of range"
+    else:
+        type_id = None
+    if not isinstance(icon, str):
+        return None, "icon must be a string"
+    return (description.strip(), url.strip(), type_id, icon.strip()), None
+
+# Bound parameters per url_hash lookup, below SQLite's historical limit of 999
+HASH_LOOKUP_CHUNK = 500
 
-def interactive(conn: sqlite3.Connection, description: str, url: str, type_id: Optional[int], icon: str) -> None:
+def _ids_by_hash(conn: sqlite3.Connection, keys: Iterable[str]) -> Dict[str, int]:
+    keys = list(keys)
+    ids: Dict[str, int] = {}
+    for start in range(0, len(keys), HASH_LOOKUP_CHUNK):
+        chunk = keys[start:start + HASH_LOOKUP_CHUNK]
+        placeholders = ','.join('?' * len(chunk))
+        ids.update(conn.execute(f"SELECT url_hash, id FROM links WHERE url_hash IN ({placeholders})", chunk))
+    return ids
+
+def add_links_bulk(conn: sqlite3.Connection, items: List[object], on_conflict: str = 'ignore',
+                   max_items: Optional[int] = MAX_BULK_LINKS) -> List[Dict]:
+    """
+    Validate and insert many links in one transaction: one lookup of the
+    stored url hashes, one executemany for the new links and one for updates
+    :param conn: Database connection
+    :param items: List of link objects (see validate_link)
+    :param on_conflict: ignore, update or error (see ON_CONFLICT_POLICIES)
+    :param max_items: Largest accepted batch (None: no limit, for local imports)
+    :return: Per-item results, {"index", "id", "status"} or {"index", "error"}
+             (a duplicate under on_conflict='error' also carries its "id")
+    """
+    if max_items is not None and len(items) > max_items:
+        raise ValueError(f"Too many links in one batch (max {max_items})")
+    if on_conflict not in ON_CONFLICT_POLICIES:
+        raise ValueError(f"Unknown on_conflict policy: {on_conflict}")
+
+    now = datetime.now()
+    results: List[Optional[Dict]] = [None] * len(items)
+    valid = []
+    for index, item in enumerate(items):
+        link, error = validate_link(item)
+        if error:
+            results[index] = {"index": index, "error": error}
+            continue
+        description, url, type_id, icon = link
+        valid.append((index, url_hash(url), (now, description, url, type_id, icon)))
+
+    try:
+        if valid and not conn.in_transaction:
+            # Take the write lock before the lookup so no other connection
+            # stores one of these URLs between the lookup and the insert
+            conn.execute("BEGIN IMMEDIATE")
+        existing = _ids_by_hash(conn, {key for _, key, _ in valid})
+        # The first occurrence of each new URL is inserted; later ones in the
+        # batch are duplicates of it, as if they had been added one by one
+        new: Dict[str, Tuple] = {}
+        for _, key, task in valid:
+            if key not in existing and key not in new:
+                new[key] = task
+        inserted: Dict[str, int] = {}
+        if new:
+            sql = ''' INSERT INTO links(date,description,url,type,icon,url_hash)
+                      VALUES(?,?,?,?,?,?) ON CONFLICT (url_hash) DO NOTHING '''
+            conn.executemany(sql, [(*task, key) for key, task in new.items()])
+            inserted = _ids_by_hash(conn, new)
+
+        updates = []
+        for index, key, task in valid:
+            if new.pop(key, None) is not None:
+                results[index] = {"index": index, "id": inserted[key], "status": "inserted"}
+                continue
+            link_id = existing.get(key) or inserted[key]
+            if on_conflict == 'error':
+                results[index] = {"index": index, "error": "duplicate url", "id": link_id}
+            elif on_conflict == 'update':
+                _, description, _, type_id, icon = task
+                updates.append((description, type_id, icon, link_id))
+                results[index] = {"index": index, "id": link_id, "status": "updated"}
+            else:
+                results[index] = {"index": index, "id": link_id, "status": "duplicate"}
+        if updates:
+            conn.executemany("UPDATE links SET description = ?, type = ?, icon = ? WHERE id = ?", updates)
+        conn.commit()
+    except Error:
+        conn.rollback()
+        raise
+
+    return results
+
+def interactive(conn:sqlite3.Connection, description: str, url: str, type_id: Optional[int], icon: str) -> int:
     
     """
     interactive mode
+    :return: ID of the link
     """
-    add_link(conn, (datetime.now(), description, url, type_id, icon))
+    link_id = add_link(conn, (datetime.now(), description, url, type_id, icon))
     logging.info("Link added successfully!")
+    return link_id
+
+def get_link_url(conn: sqlite3.Connection, link_id: int) -> Optional[str]:
+    """
+    Get the URL of one link
+    :param conn: Database connection
+    :param link_id: Link id
+    :return: URL or None if the link does not exist
+    """
+    row = conn.execute("SELECT url FROM links WHERE id = ?", (link_id,)).fetchone()
+    return row[0] if row else None
+
+def set_link_icon(conn: sqlite3.Connection, link_id: int, icon: str, expected: Optional[str]) -> bool:
+    """
+    Replace the icon of a link unless it changed in the meantime
+    :param conn: Database connection
+    :param link_id: Link id
+    :param icon: New icon
+    :param expected: Icon the new one replaces
+    :return: True if the row was updated
+    """
+    try:
+        cur = conn.execute("UPDATE links SET icon = ? WHERE id = ? AND icon IS ?", (icon, link_id, expected))
+        conn.commit()
+    except Error:
+        conn.rollback()
+        raise
+    return cur.rowcount > 0
+
+def record_clicks(conn: sqlite3.Connection, counts: Dict[int, Tuple[int, str]]) -> None:
+    """
+    Add buffered click counts in one transaction
+    :param conn: Database connection
+    :param counts: link id -> (clicks, time of the last click)
+    """
+    sql = ''' INSERT INTO clicks(link_id, count, last_click) VALUES(?,?,?)
+              ON CONFLICT (link_id) DO UPDATE SET count = count + excluded.count,
+                                                  last_click = excluded.last_click '''
+    try:
+        conn.executemany(sql, [(link_id, count, when) for link_id, (count, when) in counts.items()])
+        conn.commit()
+    except Error:
+        conn.rollback()
+        raise
+
+def links_to_check(conn: sqlite3.Connection, checked_before: Optional[str] = None,
+                   limit: Optional[int] = None) -> List[Tuple]:
+    """
+    Links never checked or last checked before a given time, oldest first
+    :param conn: Database connection
+    :param checked_before: Timestamp ('YYYY-MM-DD HH:MM:SS'); None returns every link
+    :param limit: Maximum number of links
+    :return: List of (id, url, etag, last_modified, failures)
+    """
+    sql = """SELECT l.id, l.url, s.etag, s.last_modified, COALESCE(s.failures, 0)
+             FROM links l LEFT JOIN link_status s ON s.link_id = l.id"""
+    params: List = []
+    if checked_before is not None:
+        sql += " WHERE s.checked IS NULL OR s.checked < ?"
+        params.append(checked_before)
+    sql += " ORDER BY s.checked, l.id"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    return conn.execute(sql, params).fetchall()
+
+def record_link_status(conn: sqlite3.Connection, results: List[Tuple]) -> None:
+    """
+    Store link check results in one transaction
+    :param conn: Database connection
+    :param results: (link id, status, error, checked, etag, last_modified, failures, dead) tuples
+    """
+    sql = """ INSERT INTO link_status(link_id, status, error, checked, etag, last_modified, failures, dead)
+              VALUES(?,?,?,?,?,?,?,?)
+              ON CONFLICT (link_id) DO UPDATE SET status = excluded.status, error = excluded.error,
+                  checked = excluded.checked, etag = excluded.etag, last_modified = excluded.last_modified,
+                  failures = excluded.failures, dead = excluded.dead """
+    try:
+        conn.executemany(sql, results)
+        conn.commit()
+    except Error:
+        conn.rollback()
+        raise
+
+def get_dead_links(conn: sqlite3.Connection, link_ids: Optional[List[int]] = None) -> Set[int]:
+    """
+    Ids of the links marked dead by linkcheck.py
+    :param conn: Database connection
+    :param link_ids: Only look at these links (e.g. one page of /view)
+    :return: Set of link ids
+    """
+    sql = "SELECT link_id FROM link_status WHERE dead = 1"
+    params: List = []
+    if link_ids is not None:
+        if not link_ids:
+            return set()
+        sql += " AND link_id IN ({})".format(','.join('?' * len(link_ids)))
+        params = list(link_ids)
+    return {row[0] for row in conn.execute(sql, params)}
+
+# Columns of a preview tuple, as returned by get_previews
+PREVIEW_COLUMNS = "link_id, url, status, title, description, image, fetched"
+
+def get_previews(conn: sqlite3.Connection, link_ids: List[int]) -> Dict[int, Tuple]:
+    """
+    Stored previews of some links
+    :param conn: Database connection
+    :param link_ids: Link ids
+    :return: link id -> preview tuple (see PREVIEW_COLUMNS)
+    """
+    if not link_ids:
+        return {}
+    sql = "SELECT {} FROM link_previews WHERE link_id IN ({})".format(PREVIEW_COLUMNS, ','.join('?' * len(link_ids)))
+    return {row[0]: row for row in conn.execute(sql, list(link_ids))}
+
+def store_preview(conn: sqlite3.Connection, preview: Tuple, max_rows: Optional[int] = None) -> None:
+    """
+    Insert or replace the preview of a link, dropping the oldest ones
+    beyond max_rows
+    :param conn: Database connection
+    :param preview: Preview tuple (see PREVIEW_COLUMNS)
+    :param max_rows: Maximum number of stored previews
+    """
+    sql = f""" INSERT INTO link_previews({PREVIEW_COLUMNS}) VALUES(?,?,?,?,?,?,?)
+               ON CONFLICT (link_id) DO UPDATE SET url = excluded.url, status = excluded.status,
+                   title = excluded.title, description = excluded.description,
+                   image = excluded.image, fetched = excluded.fetched """
+    try:
+        conn.execute(sql, preview)
+        if max_rows is not None:
+            conn.execute("""DELETE FROM link_previews WHERE link_id IN (
+                                SELECT link_id FROM link_previews ORDER BY fetched
+                                LIMIT max((SELECT count(*) FROM link_previews) - ?, 0))""", (max_rows,))
+        conn.commit()
+    except Error:
+        conn.rollback()
+        raise
+
+def get_change_token(conn: sqlite3.Connection) -> Tuple[int, datetime]:
+    """
+    Read the database write counter without touching the links table
+    :param conn: Database connection
+    :return: (version, UTC time of the last change)
+    """
+    version, modified = conn.execute("SELECT version, modified FROM change_log WHERE id = 1").fetchone()
+    return version, datetime.strptime(modified, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+
+def get_types(conn: sqlite3.Connection) -> List[Tuple[int, str]]:
+    """
+    Get every link type
+    :param conn: Database connection
+    :return: List of (id, name)
+    """
+    return conn.execute("SELECT id, descripcion FROM type ORDER BY id").fetchall()
+
+class TypeCache:
+    """
+    The type table kept in memory. It is reloaded when change_log.type_version
+    moves, so changes made by any process (the app never writes types) are seen.
+    """
+
+    def __init__(self):
+        self._types: Optional[List[Tuple[int, str]]] = None
+        self._version: Optional[int] = None
+        self._lock = threading.Lock()
+        self.loads = 0
+
+    def get(self, conn: sqlite3.Connection) -> List[Tuple[int, str]]:
+        """
+        :param conn: Database connection
+        :return: List of (id, name)
+        """
+        version = conn.execute("SELECT type_version FROM change_log WHERE id = 1").fetchone()[0]
+        with self._lock:
+            if self._types is not None and self._version == version:
+                return self._types
+        types = get_types(conn)
+        with self._lock:
+            self._types, self._version = types, version
+            self.loads += 1
+        return types
+
+    def stats(self) -> Dict:
+        return {"types": len(self._types or []), "version": self._version, "loads": self.loads}
 
-def get_links(conn: sqlite3.Connection, order: str = 'desc', limit: int = 10) -> List[Tuple]:
+def encode_cursor(row: Tuple) -> str:
+    """
+    Build an opaque pagination cursor from a link row
+    :param row: Link tuple (id, date, ...)
+    :return: URL-safe cursor string
+    """
+    raw = json.dumps([row[1], row[0]], default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    """
+    Decode a cursor produced by encode_cursor
+    :param cursor: Cursor string
+    :return: (date, id) of the last row of the previous page
+    :raises ValueError: if the cursor is malformed
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        date, link_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return str(date), int(link_id)
+    except (TypeError, ValueError, binascii.Error) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+# Columns of a link tuple, in the order every reader returns them
+LINK_COLUMNS = "id, date, description, url, icon, type"
+# The same, qualified for queries that join links (as l) to other tables
+LINK_COLUMNS_QUALIFIED = ", ".join(f"l.{column}" for column in LINK_COLUMNS.split(", "))
+
+# Fields a client can ask for with ?fields=, and the SQL that reads each one
+LINK_FIELDS = {
+    'id': 'l.id',
+    'date': 'l.date',
+    'description': 'l.description',
+    'url': 'l.url',
+    'icon': 'l.icon',
+    'type': 'l.type',
+    'type_name': 't.descripcion',
+}
+
+# Fields of a plain link tuple (LINK_COLUMNS)
+DEFAULT_LINK_FIELDS = tuple(LINK_COLUMNS.split(", "))
+
+def parse_fields(spec: Optional[str]) -> Optional[Tuple[str, ...]]:
+    """
+    Parse a comma-separated field list such as "id,url"
+    :param spec: Field list from the query string
+    :return: Tuple of field names in the given order, or None for every column
+    :raises ValueError: on unknown or missing field names
+    """
+    if spec is None:
+        return None
+    fields = tuple(dict.fromkeys(field.strip() for field in spec.split(',') if field.strip()))
+    if not fields:
+        raise ValueError("fields must name at least one field")
+    unknown = [field for field in fields if field not in LINK_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)} (valid: {', '.join(LINK_FIELDS)})")
+    return fields
+
+def to_columnar(columns: Sequence[str], rows: List[Tuple]) -> Dict:
+    """
+    Column-oriented form of a result: the header once and one array per column
+    :param columns: Column names
+    :param rows: Row tuples
+    :return: {"columns": [...], "data": [[values of column 0], [values of column 1], ...]}
+    """
+    data = [list(column) for column in zip(*rows)] if rows else [[] for _ in columns]
+    return {"columns": list(columns), "data": data}
+
+def get_links(conn: sqlite3.Connection, order: str = 'desc', limit: int = 10,
+              after: Optional[str] = None, type_id: Optional[int] = None,
+              hide_dead: bool = False, type_names: bool = False,
+              fields: Optional[Sequence[str]] = None) -> List[Tuple]:
     """
     Get links from the database
     :param conn: Database connection
     :param order: Order of the results (asc or desc)
     :param limit: Number of results to return
+    :param after: Cursor of the last row of the previous page
+    :param type_id: Only return links of this type
+    :param hide_dead: Leave out links marked dead by linkcheck.py
+    :param type_names: Append the type name to every tuple (joined on type.id)
+    :param fields: Only read these fields (see LINK_FIELDS), in this order
     :return: List of link tuples
     """
     cur = conn.cursor()
@@ -77,6 +921,292 @@ def get_links(conn: sqlite3.Connection, order: str = 'desc', limit: int = 10) ->
     allowed_orders = ['asc', 'desc']
     if order not in allowed_orders:
         order = 'desc'
-    cur.execute("SELECT * FROM links ORDER BY date {} LIMIT ?".format(order), (limit,))
+    # Keyset pagination on (date, id): every page is an index range scan,
+    # so deep pages cost the same as the first one
+    where = []
+    params = []
+    if type_id is not None:
+        where.append("l.type = ?")
+        params.append(type_id)
+    if after:
+        where.append("(l.date, l.id) {} (?, ?)".format('<' if order == 'desc' else '>'))
+        params.extend(decode_cursor(after))
+    if hide_dead:
+        where.append("l.id NOT IN (SELECT link_id FROM link_status WHERE dead = 1)")
+    if fields:
+        columns = ", ".join(LINK_FIELDS[field] for field in fields)
+        join = 'type_name' in fields
+    else:
+        columns = LINK_COLUMNS_QUALIFIED + (", t.descripcion" if type_names else "")
+        join = type_names
+    sql = f"SELECT {columns} FROM links l"
+    if join:
+        sql += " LEFT JOIN type t ON t.id = l.type"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY l.date {0}, l.id {0} LIMIT ?".format(order)
+    cur.execute(sql, (*params, limit))
     links = cur.fetchall()
-    return links
\ No newline at end of file
+    return links
+
+# Weights of the description and url columns in the bm25 ranking
+SEARCH_WEIGHTS = (2.0, 1.0)
+
+def build_match_query(q: str, prefix: bool = False) -> Optional[str]:
+    """
+    Turn free user text into a safe FTS5 MATCH expression: every word is
+    quoted (so FTS5 operators and punctuation in the input are inert) and
+    all words must match. In prefix mode the last word matches as a prefix.
+    :param q: User query
+    :param prefix: Autocomplete mode
+    :return: MATCH expression or None if q has no words
+    """
+    words = re.findall(r'\w+', q or '')
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    if prefix:
+        terms[-1] += '*'
+    return ' '.join(terms)
+
+# Largest page of /api/search
+MAX_SEARCH_LIMIT = 100
+
+def search_links(conn: sqlite3.Connection, q: str, limit: int = 10, after: Optional[str] = None,
+                 prefix: bool = False) -> Tuple[List[Tuple], Optional[str]]:
+    """
+    Full-text search over description and url, best matches first
+    :param conn: Database connection
+    :param q: User query
+    :param limit: Number of results to return, clamped to 1..MAX_SEARCH_LIMIT
+    :param after: Cursor returned for the previous page
+    :param prefix: Match the last word as a prefix (autocomplete)
+    :return: (list of link tuples, next cursor or None on the last page)
+    :raises ValueError: if the query is empty or the cursor is malformed
+    """
+    match = build_match_query(q, prefix)
+    if match is None:
+        raise ValueError("Empty search query")
+    # A negative LIMIT is unbounded in SQLite
+    limit = max(1, min(limit, MAX_SEARCH_LIMIT))
+    params: List = [match]
+    # Keyset pagination on (score, id); bm25 scores are negative, lower is better
+    sql = """SELECT l.id, l.date, l.description, l.url, l.icon, l.type, s.score
+             FROM (SELECT rowid, bm25(links_fts, {}, {}) AS score
+                   FROM links_fts WHERE links_fts MATCH ?) s
+             JOIN links l ON l.id = s.rowid""".format(*SEARCH_WEIGHTS)
+    if after:
+        sql += " WHERE (s.score, l.id) > (?, ?)"
+        params.extend(_decode_search_cursor(after))
+    sql += " ORDER BY s.score, l.id LIMIT ?"
+    rows = conn.execute(sql, (*params, limit + 1)).fetchall()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_search_cursor(rows[-1][6], rows[-1][0])
+    return [row[:6] for row in rows], next_cursor
+
+def _encode_search_cursor(score: float, link_id: int) -> str:
+    raw = json.dumps([score, link_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def _decode_search_cursor(cursor: str) -> Tuple[float, int]:
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        score, link_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return float(score), int(link_id)
+    except (TypeError, ValueError, binascii.Error) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+# Largest page of /api/links and /view (large pages are for ?fields= / columnar exports)
+MAX_LINKS_LIMIT = 10000
+
+def get_links_page(conn: sqlite3.Connection, order: str = 'desc', limit: int = 10,
+                   after: Optional[str] = None, type_id: Optional[int] = None,
+                   hide_dead: bool = False, type_names: bool = False,
+                   fields: Optional[Sequence[str]] = None) -> Tuple[List[Tuple], Optional[str]]:
+    """
+    Get one page of links and the cursor of the next page
+    :param conn: Database connection
+    :param order: Order of the results (asc or desc)
+    :param limit: Number of results to return, clamped to 1..MAX_LINKS_LIMIT
+    :param after: Cursor returned for the previous page
+    :param type_id: Only return links of this type
+    :param hide_dead: Leave out links marked dead by linkcheck.py
+    :param type_names: Append the type name to every tuple (joined on type.id)
+    :param fields: Only return these fields (see LINK_FIELDS), in this order
+    :return: (list of link tuples, next cursor or None on the last page)
+    """
+    # A negative LIMIT is unbounded in SQLite
+    limit = max(1, min(limit, MAX_LINKS_LIMIT))
+    # The cursor needs id and date: read them even if they were not asked for
+    extra = tuple(field for field in ('id', 'date') if fields and field not in fields)
+    columns = (*fields, *extra) if fields else None
+    links = get_links(conn, order=order, limit=limit + 1, after=after, type_id=type_id,
+                      hide_dead=hide_dead, type_names=type_names, fields=columns)
+    next_cursor = None
+    if len(links) > limit:
+        links = links[:limit]
+        last = links[-1]
+        next_cursor = encode_cursor((last[columns.index('id')], last[columns.index('date')]) if columns else last)
+    if extra:
+        links = [link[:len(fields)] for link in links]
+    return links, next_cursor
+
+def iter_links(conn: sqlite3.Connection, order: str = 'asc', batch_size: int = 1000) -> Iterator[Tuple]:
+    """
+    Iterate over every link without loading the table in memory
+    :param conn: Database connection
+    :param order: Order by id (asc or desc)
+    :param batch_size: Rows fetched from the cursor at a time
+    :return: Iterator of link tuples; the first item is the tuple of column names
+    """
+    if order not in ('asc', 'desc'):
+        order = 'asc'
+    cur = conn.cursor()
+    cur.execute("SELECT {} FROM links ORDER BY id {}".format(LINK_COLUMNS, order))
+    yield tuple(column[0] for column in cur.description)
+    while True:
+        rows = cur.fetchmany(batch_size)
+        if not rows:
+            break
+        yield from rows
+
+class BatchWriter:
+    """
+    Single writer thread that group-commits link inserts.
+    Callers put tasks on a bounded queue and wait for their id; the writer
+    drains up to max_batch tasks (or whatever arrives within max_delay
+    seconds) and inserts them in one transaction, so many inserts share
+    one fsync and writers in this process never contend for the lock.
+    """
+
+    def __init__(self, db_file: str, max_batch: int = 500, max_delay: float = 0.005, queue_size: int = 10000):
+        self.db_file = db_file
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.pid = getpid()
+        self._queue: "queue.Queue[Tuple[Tuple, str, Future]]" = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self.batches = 0
+        self.rows = 0
+        self.last_batch = 0
+        self.max_seen_batch = 0
+        self._thread = threading.Thread(target=self._run, name='link-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, task: Tuple[datetime, str, str, Optional[int], str], timeout: Optional[float] = 5,
+               on_conflict: str = 'ignore') -> Future:
+        """
+        Queue a link insert
+        :param task: Tuple with link data (date, description, url, type, icon)
+        :param timeout: Seconds to wait for room in the queue
+        :param on_conflict: ignore, update or error (see ON_CONFLICT_POLICIES)
+        :return: Future resolved with (link id, status) as returned by insert_link
+        :raises queue.Full: if the queue stays full for timeout seconds
+        """
+        if on_conflict not in ON_CONFLICT_POLICIES:
+            raise ValueError(f"Unknown on_conflict policy: {on_conflict}")
+        future: Future = Future()
+        self._queue.put((task, on_conflict, future), timeout=timeout)
+        return future
+
+    def add(self, task: Tuple[datetime, str, str, Optional[int], str], timeout: Optional[float] = 30,
+            on_conflict: str = 'ignore') -> Tuple[int, str]:
+        """
+        Insert a link through the writer and wait for it
+        :return: (link id, 'inserted' | 'duplicate' | 'updated')
+        :raises DuplicateLinkError: with on_conflict='error' if the URL exists
+        """
+        return self.submit(task, on_conflict=on_conflict).result(timeout)
+
+    def _collect(self) -> List[Tuple[Tuple, str, Future]]:
+        try:
+            batch = [self._queue.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        conn = None
+        while not self._stop.is_set():
+            # Tasks whose caller gave up (cancelled future) are not inserted
+            batch = [item for item in self._collect() if item[2].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            if conn is None:
+                conn = create_connection(self.db_file)
+            if conn is None:
+                for _, _, future in batch:
+                    future.set_exception(Error(f"Unable to open database {self.db_file}"))
+                continue
+
+            results = []
+            try:
+                for task, on_conflict, future in batch:
+                    # A bad task (e.g. an int SQLite can't store) fails only its own future
+                    try:
+                        results.append((future, insert_link(conn, task, on_conflict), None))
+                    except Exception as e:
+                        results.append((future, None, e))
+                conn.commit()
+            except Exception as e:
+                try:
+                    conn.rollback()
+                except Error:
+                    conn.close()
+                    conn = None
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            for future, result, error in results:
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+            self.batches += 1
+            self.rows += len(batch)
+            self.last_batch = len(batch)
+            self.max_seen_batch = max(self.max_seen_batch, len(batch))
+        if conn is not None:
+            conn.close()
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "queue_depth": self._queue.qsize(),
+            "batches": self.batches,
+            "rows": self.rows,
+            "last_batch": self.last_batch,
+            "max_batch": self.max_seen_batch,
+            "avg_batch": round(self.rows / self.batches, 2) if self.batches else 0
+        }
+
+    def is_alive(self) -> bool:
+        return self._thread.is_alive()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join(timeout=2)
+
+_writers: Dict[str, BatchWriter] = {}
+
+def get_writer(db_file: str, max_batch: int = 500, max_delay: float = 0.005, queue_size: int = 10000) -> BatchWriter:
+    """
+    Return the group-commit writer for db_file, starting it on first use
+    (and again in a forked child, where the parent's thread does not exist,
+    or if the writer thread has died)
+    :return: BatchWriter
+    """
+    with _pools_lock:
+        writer = _writers.get(db_file)
+        if writer is None or writer.pid != getpid() or not writer.is_alive():
+            writer = _writers[db_file] = BatchWriter(db_file, max_batch, max_delay, queue_size)
+        return writer
@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+"""
+Local icon store.
+Icons given as http(s) or data: URLs (or, for links without an icon, the
+site's /favicon.ico) are fetched once, resized when Pillow is installed and
+stored content-addressed under icon_dir. The icon column is then rewritten
+to /icons/<hash>, which the app serves with immutable cache headers, so
+page loads never hit third-party hosts.
+"""
+
+import os
+import re
+import sys
+import base64
+import socket
+import hashlib
+import logging
+import argparse
+import binascii
+import ipaddress
+import importlib.util
+import threading
+from io import BytesIO
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Deque, Iterable, Optional, Tuple
+from urllib.parse import urlsplit, urljoin, unquote_to_bytes
+import requests
+
+from dbtools import get_pool, set_link_icon
+from staticsite import rebuild_after_write
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+ICON_PREFIX = '/icons/'
+HASH_RE = re.compile(r'^[0-9a-f]{32}$')
+MAX_REDIRECTS = 3
+
+# Leading bytes of the image formats accepted without Pillow
+MAGIC = [
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x00\x00\x01\x00', 'image/x-icon'),
+    (b'RIFF', 'image/webp'),
+]
+
+def sniff(data: bytes) -> Optional[str]:
+    """
+    Detect the image type from its first bytes
+    :return: MIME type or None if data is not a supported image
+    """
+    for magic, mimetype in MAGIC:
+        if data.startswith(magic):
+            if mimetype == 'image/webp' and data[8:12] != b'WEBP':
+                continue
+            return mimetype
+    head = data[:512].lstrip().lower()
+    if head.startswith(b'<svg') or (head.startswith(b'<?xml') and b'<svg' in head):
+        return 'image/svg+xml'
+    return None
+
+def check_host(url: str, allow_private: bool = False) -> bool:
+    """
+    Refuse to fetch from loopback, private or link-local addresses.
+    Callers that follow redirects check every hop (see IconStore.fetch).
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        return False
+    if allow_private:
+        return True
+    try:
+        infos = socket.getaddrinfo(parts.hostname, parts.port or 80, proto=socket.IPPROTO_TCP)
+    except OSError:
+        return False
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split('%')[0])
+        if not address.is_global:
+            return False
+    return True
+
+class IconStore:
+    """
+    Content-addressed icon files: <root>/<hash[:2]>/<hash>
+    """
+
+    def __init__(self, root: str, size: int = 64, max_bytes: int = 512 * 1024,
+                 timeout: float = 5, allow_private: bool = False):
+        self.root = root
+        self.size = size
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.allow_private = allow_private
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = 'slink3-icons'
+
+    def path(self, icon_hash: str) -> str:
+        return os.path.join(self.root, icon_hash[:2], icon_hash)
+
+    def normalize(self, data: bytes) -> Optional[bytes]:
+        """
+        Resize raster icons to at most size x size PNG (with Pillow);
+        SVG and, without Pillow, any recognised format are kept as they are
+        :return: Bytes to store or None if data is not an image
+        """
+        mimetype = sniff(data)
+        if mimetype is None:
+            return None
+        if Image is None or mimetype == 'image/svg+xml':
+            return data
+        try:
+            with Image.open(BytesIO(data)) as image:
+                image = image.convert('RGBA')
+                image.thumbnail((self.size, self.size))
+                out = BytesIO()
+                image.save(out, format='PNG', optimize=True)
+                return out.getvalue()
+        except Exception:
+            return None
+
+    def store(self, data: bytes) -> Optional[str]:
+        """
+        Store an icon
+        :return: Hash of the stored file or None if data is not an image
+        """
+        data = self.normalize(data)
+        if data is None:
+            return None
+        icon_hash = hashlib.sha256(data).hexdigest()[:32]
+        target = self.path(icon_hash)
+        if not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            tmp = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, target)
+        return icon_hash
+
+    def read(self, icon_hash: str) -> Optional[Tuple[bytes, str]]:
+        """
+        :return: (icon bytes, MIME type) or None if there is no such icon
+        """
+        if not HASH_RE.match(icon_hash):
+            return None
+        try:
+            with open(self.path(icon_hash), 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        return data, sniff(data) or 'application/octet-stream'
+
+    def fetch(self, url: str) -> Optional[str]:
+        """
+        Download an icon and store it
+        :return: Hash of the stored file or None on any failure
+        """
+        for _ in range(MAX_REDIRECTS + 1):
+            if not check_host(url, self.allow_private):
+                return None
+            try:
+                with self.session.get(url, timeout=self.timeout, stream=True, allow_redirects=False) as response:
+                    if response.is_redirect:
+                        url = urljoin(url, response.headers['Location'])
+                        continue
+                    if response.status_code != 200:
+                        return None
+                    data = b''
+                    for chunk in response.iter_content(16384):
+                        data += chunk
+                        if len(data) > self.max_bytes:
+                            return None
+            except requests.RequestException as e:
+                logging.info(f"Icon fetch failed for {url}: {e}")
+                return None
+            return self.store(data)
+        return None
+
+    def store_data_url(self, icon: str) -> Optional[str]:
+        """Store an icon given as a data: URL"""
+        header, _, payload = icon[5:].partition(',')
+        try:
+            data = base64.b64decode(payload, validate=False) if header.endswith(';base64') \
+                else unquote_to_bytes(payload)
+        except (binascii.Error, ValueError):
+            return None
+        if len(data) > self.max_bytes:
+            return None
+        return self.store(data)
+
+    def localize(self, icon: Optional[str], link_url: Optional[str], fetch_favicon: bool = True) -> Optional[str]:
+        """
+        Local replacement for the icon of a link
+        :param icon: Current value of the icon column
+        :param link_url: URL of the link (for its /favicon.ico)
+        :return: '/icons/<hash>' or None if the icon should stay as it is
+        """
+        icon = (icon or '').strip()
+        icon_hash = None
+        if icon.startswith(ICON_PREFIX):
+            return None
+        if icon.startswith('data:'):
+            icon_hash = self.store_data_url(icon)
+        elif icon.startswith(('http://', 'https://')):
+            icon_hash = self.fetch(icon)
+        elif not icon and fetch_favicon and link_url:
+            parts = urlsplit(link_url)
+            if parts.scheme in ('http', 'https') and parts.netloc:
+                icon_hash = self.fetch(f"{parts.scheme}://{parts.netloc}/favicon.ico")
+        return f"{ICON_PREFIX}{icon_hash}" if icon_hash else None
+
+_stores = {}
+_executors = {}
+_lock = threading.Lock()
+
+def get_icon_store(config_module) -> Optional[IconStore]:
+    """
+    Icon store of a configuration; None when icon_dir is set to None/False.
+    By default icons live in an 'icons' directory next to the database.
+    """
+    default_dir = os.path.join(os.path.dirname(os.path.abspath(config_module.dbpath)), 'icons')
+    root = getattr(config_module, 'icon_dir', default_dir)
+    if not root:
+        return None
+    with _lock:
+        store = _stores.get(root)
+        if store is None:
+            store = _stores[root] = IconStore(
+                root,
+                size=getattr(config_module, 'icon_size', 64),
+                max_bytes=getattr(config_module, 'icon_max_bytes', 512 * 1024),
+                timeout=getattr(config_module, 'icon_fetch_timeout', 5),
+                allow_private=getattr(config_module, 'icon_allow_private', False)
+            )
+        return store
+
+def _executor() -> ThreadPoolExecutor:
+    # Per process: the threads of a parent do not survive fork()
+    with _lock:
+        executor = _executors.get(os.getpid())
+        if executor is None:
+            executor = _executors[os.getpid()] = ThreadPoolExecutor(2, thread_name_prefix='icons')
+        return executor
+
+def localize_links(config_module, links: Iterable[Tuple[int, str, str]], rebuild: bool = True) -> int:
+    """
+    Localize the icons of some links and update their rows
+    :param links: (link id, icon, url) tuples
+    :param rebuild: Regenerate the static site if any row changed
+    :return: Number of links updated
+    """
+    store = get_icon_store(config_module)
+    if store is None:
+        return 0
+    fetch_favicon = getattr(config_module, 'icon_fetch_favicon', True)
+    updated = 0
+    for link_id, icon, url in links:
+        new_icon = store.localize(icon, url, fetch_favicon)
+        if new_icon is None:
+            continue
+        with get_pool(config_module.dbpath).connection() as conn:
+            if conn and set_link_icon(conn, link_id, new_icon, icon):
+                updated += 1
+    if updated and rebuild:
+        rebuild_after_write(config_module)
+    return updated
+
+def localize_icons(config_module, links: Iterable[Tuple[int, str, str]]) -> Optional[Future]:
+    """
+    Localize the icons of newly added links in the background, so adding
+    a link never waits on a third-party host
+    :param links: (link id, icon, url) tuples
+    :return: Future with the number of links updated, or None if there is nothing to do
+    """
+    links = list(links)
+    if not links or get_icon_store(config_module) is None:
+        return None
+    future = _executor().submit(localize_links, config_module, links)
+    future.add_done_callback(_log_failure)
+    return future
+
+def _log_failure(future: Future) -> None:
+    if future.exception() is not None:
+        logging.error(f"Error localizing icons: {future.exception()}")
+
+def load_config(config_file):
+    if not os.path.isfile(config_file):
+        raise FileNotFoundError(f"Config file '{config_file}' does not exist.")
+    spec = importlib.util.spec_from_file_location("config", config_file)
+    config_module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(config_module)
+    return config_module
+
+class BulkLocalizer:
+    """
+    Localizes the icons of a stream of links (a table scan, the chunks of an
+    import) from a thread pool. At most 4 links per worker are queued, so
+    the stream is never read ahead, and the static site is rebuilt once, in
+    close(), instead of once per updated link.
+    """
+
+    def __init__(self, config_module, workers: int = 8):
+        self.config_module = config_module
+        self.workers = workers
+        self.updated = 0
+        self.tried = 0
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix='icons-bulk')
+        self._pending: Deque[Future] = deque()
+
+    def _localize(self, link: Tuple[int, str, str]) -> int:
+        try:
+            return localize_links(self.config_module, [link], rebuild=False)
+        except Exception as e:
+            logging.error(f"Error localizing the icon of link {link[0]}: {e}")
+            return 0
+
+    def add(self, links: Iterable[Tuple[int, str, str]]) -> None:
+        for link in links:
+            self._pending.append(self._executor.submit(self._localize, link))
+            self.tried += 1
+            if len(self._pending) >= self.workers * 4:
+                self.updated += self._pending.popleft().result()
+
+    def close(self, rebuild: bool = True) -> Tuple[int, int]:
+        """
+        Wait for the queued links
+        :param rebuild: Regenerate the static site if any row changed
+        :return: (links updated, links tried)
+        """
+        while self._pending:
+            self.updated += self._pending.popleft().result()
+        self._executor.shutdown()
+        if self.updated and rebuild:
+            rebuild_after_write(self.config_module)
+        return self.updated, self.tried
+
+def main() -> None:
+    """
+    Localize the icons of every link already in the database
+    """
+    parser = argparse.ArgumentParser(description='Fetch and store link icons locally')
+    parser.add_argument('-c', '--config', type=str, default='config.py', help='Config file')
+    parser.add_argument('-w', '--workers', type=int, default=8, help='Concurrent downloads')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    config = load_config(args.config)
+    if get_icon_store(config) is None:
+        print("icon_dir is disabled in the config")
+        sys.exit(1)
+    localizer = BulkLocalizer(config, args.workers)
+    with get_pool(config.dbpath).connection() as conn:
+        if not conn:
+            print("Unable to open the database")
+            sys.exit(1)
+        localizer.add(conn.execute("SELECT id, icon, url FROM links WHERE icon IS NULL OR icon NOT LIKE ?",
+                                   (f"{ICON_PREFIX}%",)))
+    updated, total = localizer.close()
+    print(f"{updated} of {total} icons stored locally")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+import csv
+import json
+import sys
+import time
+import logging
+import sqlite3
+from os import path, replace
+from itertools import islice
+from typing import IO, Callable, Dict, Iterator, List, Optional, Tuple
+from dbtools import add_links_bulk, validate_link
+
+DEFAULT_CHUNK_SIZE = 5000
+
+def detect_format(filename: str) -> str:
+    """
+    Guess the import format from the file extension
+    :param filename: Path of the file to import ('-' for stdin)
+    :return: 'csv' or 'jsonl'
+    """
+    return 'csv' if filename.lower().endswith('.csv') else 'jsonl'
+
+def iter_records(stream: IO[str], fmt: str) -> Iterator[Tuple[int, object]]:
+    """
+    Lazily parse a CSV (with header) or JSONL stream
+    :param stream: Text stream
+    :param fmt: 'csv' or 'jsonl'
+    :return: Iterator of (line number, record); unparsable JSON lines yield None
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for lineno, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                yield lineno, json.loads(line)
+            except ValueError:
+                yield lineno, None
+
+def skip_until(records: Iterator[Tuple[int, object]], line: int) -> Iterator[Tuple[int, object]]:
+    """
+    Drop records up to and including the given line (resume support)
+    """
+    for lineno, record in records:
+        if lineno > line:
+            yield lineno, record
+
+def chunked(records: Iterator[Tuple[int, object]], size: int) -> Iterator[List[Tuple[int, object]]]:
+    """
+    Group records in lists of at most size items
+    """
+    while True:
+        chunk = list(islice(records, size))
+        if not chunk:
+            return
+        yield chunk
+
+def read_checkpoint(checkpoint: Optional[str]) -> int:
+    """
+    Read the last committed line from a checkpoint file
+    :return: Line number, 0 if there is no checkpoint
+    """
+    if not checkpoint or not path.isfile(checkpoint):
+        return 0
+    with open(checkpoint, 'r') as f:
+        return int(f.read().strip() or 0)
+
+def write_checkpoint(checkpoint: Optional[str], line: int) -> None:
+    if not checkpoint:
+        return
+    tmp = f"{checkpoint}.tmp"
+    with open(tmp, 'w') as f:
+        f.write(str(line))
+    replace(tmp, checkpoint)
+
+def import_links(conn: sqlite3.Connection, stream: IO[str], fmt: str,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE, start_line: int = 0,
+                 checkpoint: Optional[str] = None, progress: bool = True,
+                 on_conflict: str = 'ignore',
+                 on_written: Optional[Callable[[List[Tuple[int, str, str]]], None]] = None) -> Dict[str, int]:
+    """
+    Stream links from a CSV/JSONL file into the database.
+    Each chunk is one transaction; after it commits, its last line is
+    written to the checkpoint file so a crashed import can resume there.
+    :param conn: Database connection
+    :param stream: Text stream to read
+    :param fmt: 'csv' or 'jsonl'
+    :param chunk_size: Rows per transaction
+    :param start_line: Skip every line up to this one
+    :param checkpoint: Path of the checkpoint file (optional)
+    :param progress: Show the import rate on stderr
+    :param on_conflict: Policy for URLs already stored (ignore, update or error)
+    :param on_written: Called after each chunk commits with the (id, icon, url)
+                       of the links it inserted or updated
+    :return: Counters (inserted, duplicates, failed, last_line)
+    """
+    stats = {"inserted": 0, "duplicates": 0, "failed": 0, "last_line": start_line}
+    started = time.monotonic()
+
+    records = skip_until(iter_records(stream, fmt), start_line)
+    for chunk in chunked(records, chunk_size):
+        # Unparsable lines reach add_links_bulk as None and are reported as errors;
+        # MAX_BULK_LINKS caps HTTP requests, not the chunks of a local import
+        results = add_links_bulk(conn, [record for _, record in chunk], on_conflict, max_items=None)
+        written = []
+        for result in results:
+            if "error" in result:
+                stats["failed"] += 1
+                logging.warning(f"Line {chunk[result['index']][0]}: {result['error']}")
+            elif result["status"] == 'duplicate':
+                stats["duplicates"] += 1
+            else:
+                stats["inserted"] += 1
+                written.append(result)
+        stats["last_line"] = chunk[-1][0]
+        write_checkpoint(checkpoint, stats["last_line"])
+        if on_written and written:
+            links = [(r["id"], validate_link(chunk[r["index"]][1])[0]) for r in written]
+            on_written([(link_id, icon, url) for link_id, (_, url, _, icon) in links])
+
+        if progress:
+            elapsed = max(time.monotonic() - started, 1e-6)
+            done = stats["inserted"] + stats["duplicates"] + stats["failed"]
+            sys.stderr.write(f"\r{done} rows ({stats['inserted']} inserted, {stats['duplicates']} duplicates, "
+                             f"{stats['failed']} failed) "
+                             f"{done / elapsed:,.0f} rows/s, line {stats['last_line']}")
+            sys.stderr.flush()
+
+    if progress:
+        sys.stderr.write("\n")
+    return stats
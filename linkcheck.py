@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Link liveness checker.
+Probes every URL of the links table from a bounded thread pool, at most
+per_host_rate requests per second to any one host. A HEAD is tried first
+and a GET when the server rejects it; the ETag / Last-Modified of the last
+check are sent back so an unchanged page answers 304. Results go to the
+link_status table, and a link is marked dead after dead_after failed
+checks in a row.
+"""
+
+import os
+import sys
+import time
+import signal
+import subprocess
+import logging
+import argparse
+import importlib.util
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+import requests
+
+from dbtools import get_pool, links_to_check, record_link_status
+from staticsite import rebuild_after_write
+
+# Statuses of a HEAD that are retried with a GET: servers that do not
+# implement HEAD often answer one of these instead
+HEAD_FALLBACK_STATUSES = {400, 403, 404, 405, 406, 429, 500, 501, 502, 503}
+
+class HostRateLimiter:
+    """
+    Spaces requests to the same host at least 1/rate seconds apart
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def wait(self, host: str) -> None:
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next.get(host, now))
+            self._next[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+def host_of(url: str) -> str:
+    """Lower-case host of a URL; '' when the URL cannot be parsed"""
+    try:
+        return (urlsplit(url).hostname or '').lower()
+    except ValueError:
+        return ''
+
+def interleave_by_host(links: Iterable[Tuple]) -> List[Tuple]:
+    """
+    Reorder links round-robin by host, so the pool works on many hosts at
+    once instead of queueing behind the rate limit of a single one
+    """
+    by_host = defaultdict(deque)
+    for link in links:
+        by_host[host_of(link[1] or '')].append(link)
+    queues = list(by_host.values())
+    ordered = []
+    while queues:
+        for q in queues:
+            ordered.append(q.popleft())
+        queues = [q for q in queues if q]
+    return ordered
+
+class LinkChecker:
+    """
+    Probes link URLs and builds link_status rows
+    """
+
+    def __init__(self, workers: int = 16, per_host_rate: float = 1.0, timeout: float = 10,
+                 dead_after: int = 2, user_agent: str = 'slink3-linkcheck'):
+        self.workers = workers
+        self.timeout = timeout
+        self.dead_after = dead_after
+        self.limiter = HostRateLimiter(per_host_rate)
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = user_agent
+        # One pooled connection per worker is enough
+        adapter = requests.adapters.HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _request(self, method: str, url: str, headers: Dict) -> requests.Response:
+        self.limiter.wait(host_of(url))
+        response = self.session.request(method, url, headers=headers, timeout=self.timeout,
+                                        allow_redirects=True, stream=True)
+        # Only the status line and headers matter: the body is never read
+        response.close()
+        return response
+
+    def probe(self, url: str, etag: Optional[str] = None,
+              last_modified: Optional[str] = None) -> Tuple[Optional[int], Optional[str], Optional[str], Optional[str]]:
+        """
+        Check one URL
+        :param etag: ETag of the last successful check
+        :param last_modified: Last-Modified of the last successful check
+        :return: (HTTP status, error, etag, last_modified); status is None on
+                 connection errors
+        """
+        try:
+            parts = urlsplit(url)
+        except ValueError as e:
+            # A malformed stored URL is one failed check, not the end of the run
+            return None, f"Invalid URL: {e}"[:500], None, None
+        if parts.scheme not in ('http', 'https') or not parts.netloc:
+            return None, "Not an http(s) URL", None, None
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        try:
+            response = self._request('HEAD', url, headers)
+            if response.status_code in HEAD_FALLBACK_STATUSES:
+                response = self._request('GET', url, headers)
+        except requests.RequestException as e:
+            return None, f"{type(e).__name__}: {e}"[:500], etag, last_modified
+        if response.status_code == 304:
+            return 304, None, etag, last_modified
+        if response.status_code >= 400:
+            return response.status_code, f"HTTP {response.status_code} {response.reason or ''}".strip(), None, None
+        return response.status_code, None, response.headers.get('ETag'), response.headers.get('Last-Modified')
+
+    def check(self, link: Tuple) -> Tuple:
+        """
+        :param link: (id, url, etag, last_modified, failures) as returned by links_to_check
+        :return: link_status row (see record_link_status)
+        """
+        link_id, url, etag, last_modified, failures = link
+        status, error, etag, last_modified = self.probe(url or '', etag, last_modified)
+        failures = failures + 1 if error else 0
+        checked = datetime.now().isoformat(sep=' ', timespec='seconds')
+        return (link_id, status, error, checked, etag, last_modified, failures, int(failures >= self.dead_after))
+
+    def check_all(self, links: Iterable[Tuple]) -> Iterator[Tuple]:
+        """
+        Check links concurrently; yields link_status rows in input order.
+        At most 4 checks per worker are queued, so a large table is not
+        turned into one future per link up front.
+        """
+        executor = ThreadPoolExecutor(self.workers, thread_name_prefix='linkcheck')
+        pending = deque()
+        try:
+            for link in interleave_by_host(links):
+                pending.append(executor.submit(self.check, link))
+                if len(pending) >= self.workers * 4:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            # Also reached when the caller stops iterating early
+            executor.shutdown(wait=True, cancel_futures=True)
+
+def checker_from_config(config_module) -> LinkChecker:
+    return LinkChecker(
+        workers=getattr(config_module, 'linkcheck_workers', 16),
+        per_host_rate=getattr(config_module, 'linkcheck_per_host_rate', 1.0),
+        timeout=getattr(config_module, 'linkcheck_timeout', 10),
+        dead_after=getattr(config_module, 'linkcheck_dead_after', 2)
+    )
+
+def check_links(config_module, max_age: Optional[float] = None, batch_size: int = 200,
+                checker: Optional[LinkChecker] = None, stop: Optional[threading.Event] = None) -> Dict:
+    """
+    Check the links of a database and store the results
+    :param max_age: Only check links not checked in this many seconds (None: all)
+    :param batch_size: Results written per transaction
+    :param stop: Event that interrupts the run between batches
+    :return: {"checked", "dead", "seconds"}
+    """
+    checker = checker or checker_from_config(config_module)
+    checked_before = None
+    if max_age is not None:
+        checked_before = (datetime.now() - timedelta(seconds=max_age)).isoformat(sep=' ', timespec='seconds')
+    pool = get_pool(config_module.dbpath)
+    with pool.connection() as conn:
+        if not conn:
+            raise RuntimeError(f"Unable to open database {config_module.dbpath}")
+        links = links_to_check(conn, checked_before)
+
+    started = time.monotonic()
+    checked = dead = 0
+    batch: List[Tuple] = []
+
+    def write():
+        with pool.connection() as conn:
+            record_link_status(conn, batch)
+
+    for row in checker.check_all(links):
+        batch.append(row)
+        dead += row[7]
+        if len(batch) >= batch_size:
+            write()
+            checked += len(batch)
+            batch = []
+            if stop is not None and stop.is_set():
+                break
+    if batch:
+        write()
+        checked += len(batch)
+    if checked:
+        # Only rewrites the static pages whose content changed
+        rebuild_after_write(config_module)
+    return {"checked": checked, "dead": dead, "seconds": round(time.monotonic() - started, 2)}
+
+class LinkCheckJob:
+    """
+    Background thread that re-checks every link older than interval seconds
+    """
+
+    def __init__(self, config_module, interval: float):
+        self.config_module = config_module
+        self.interval = interval
+        self.last_run: Optional[Dict] = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='linkcheck', daemon=True)
+
+    def start(self) -> 'LinkCheckJob':
+        self._thread.start()
+        return self
+
+    def run(self) -> None:
+        """Checks in the calling thread until stop() is called"""
+        self._run()
+
+    def _run(self) -> None:
+        checker = checker_from_config(self.config_module)
+        while not self._stop.is_set():
+            try:
+                self.last_run = check_links(self.config_module, max_age=self.interval,
+                                            checker=checker, stop=self._stop)
+                logging.info(f"Link check: {self.last_run}")
+            except Exception as e:
+                logging.error(f"Error checking links: {e}")
+            # Links become due one by one as they age, so look again well before interval
+            self._stop.wait(min(self.interval, 3600))
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def stats(self) -> Dict:
+        return {"interval": self.interval, "last_run": self.last_run}
+
+def spawn_job(config_file: str, interval: float) -> subprocess.Popen:
+    """
+    Runs the periodic check as its own process (linkcheck.py --interval),
+    for a parent that forks workers and so must not keep a thread alive
+    """
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'linkcheck.py')
+    return subprocess.Popen([sys.executable, script, '-c', config_file, '--interval', str(interval)])
+
+def load_config(config_file):
+    if not os.path.isfile(config_file):
+        raise FileNotFoundError(f"Config file '{config_file}' does not exist.")
+    spec = importlib.util.spec_from_file_location("config", config_file)
+    config_module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(config_module)
+    return config_module
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Check which links are still alive')
+    parser.add_argument('-c', '--config', type=str, default='config.py', help='Config file')
+    parser.add_argument('--max-age', type=float, help='Only check links not checked in this many seconds')
+    parser.add_argument('-w', '--workers', type=int, help='Concurrent checks (default: linkcheck_workers)')
+    parser.add_argument('--rate', type=float, help='Requests per second to one host (default: linkcheck_per_host_rate)')
+    parser.add_argument('--interval', type=float, help='Keep running and re-check links older than this many seconds')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    config = load_config(args.config)
+    if args.workers:
+        config.linkcheck_workers = args.workers
+    if args.rate:
+        config.linkcheck_per_host_rate = args.rate
+    if args.interval:
+        job = LinkCheckJob(config, args.interval)
+        signal.signal(signal.SIGTERM, lambda signum, frame: job.stop())
+        try:
+            job.run()
+        except KeyboardInterrupt:
+            pass
+        return
+    try:
+        result = check_links(config, max_age=args.max_age)
+    except RuntimeError as e:
+        print(e)
+        sys.exit(1)
+    print(f"{result['checked']} links checked in {result['seconds']} s, {result['dead']} dead")
+
+if __name__ == '__main__':
+    main()
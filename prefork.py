@@ -0,0 +1,148 @@
+"""
+Servidor prefork: un procés pare obre el socket i crea N workers amb fork()
+que l'hereten i hi accepten connexions. El pare reinicia els workers que
+moren i, amb SIGTERM/SIGINT, els demana que acabin les peticions en curs.
+Només funciona en sistemes POSIX (os.fork).
+"""
+
+import os
+import sys
+import time
+import signal
+import socket
+import threading
+from werkzeug.serving import make_server
+
+# Si un worker mor abans d'aquest temps s'espera abans de tornar-lo a crear
+MIN_WORKER_LIFETIME = 1.0
+
+def _serve_wsgi(app, sock):
+    """Bucle d'un worker WSGI sobre el socket heretat"""
+    server = make_server(*sock.getsockname()[:2], app, threaded=True, fd=sock.fileno())
+    # Fils no dimoni: server_close() espera les peticions en curs
+    server.daemon_threads = False
+
+    def drain(signum, frame):
+        # shutdown() espera que serve_forever() acabi: s'ha de cridar des d'un altre fil
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, drain)
+    signal.signal(signal.SIGINT, drain)
+    server.serve_forever()
+    server.server_close()
+
+def _serve_asgi(app, sock):
+    """Bucle d'un worker ASGI (uvicorn ja atén SIGTERM i acaba les peticions en curs)"""
+    from asyncapi import serve
+    # En acabar, uvicorn torna a llançar el senyal rebut amb el gestor anterior:
+    # un gestor buit deixa que el worker surti pel camí normal (on_worker_exit)
+    signal.signal(signal.SIGTERM, lambda signum, frame: None)
+    signal.signal(signal.SIGINT, lambda signum, frame: None)
+    serve(app, None, None, sock=sock)
+
+class PreforkServer:
+    """
+    Pare dels workers
+    :param make_app: funció cridada dins de cada worker, després del fork,
+                     que retorna l'aplicació (WSGI o ASGI) a servir
+    :param on_worker_exit: funció cridada quan un worker acaba de servir
+                           (els workers surten amb os._exit, sense atexit)
+    """
+
+    def __init__(self, make_app, host, port, workers=2, graceful_timeout=30, asgi=False, backlog=2048,
+                 on_worker_exit=None):
+        if not hasattr(os, 'fork'):
+            raise RuntimeError("El mode --workers necessita os.fork (sistemes POSIX)")
+        self.make_app = make_app
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.graceful_timeout = graceful_timeout
+        self.asgi = asgi
+        self.backlog = backlog
+        self.on_worker_exit = on_worker_exit
+        self.sock = None
+        self.children = {}  # pid -> hora de creació
+        self.stopping = False
+
+    def _spawn(self):
+        pid = os.fork()
+        if pid:
+            self.children[pid] = time.monotonic()
+            return
+        # Worker: no ha d'executar els atexit del pare (aturarien el servei addlink)
+        code = 0
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            app = self.make_app()
+            (_serve_asgi if self.asgi else _serve_wsgi)(app, self.sock)
+            if self.on_worker_exit:
+                self.on_worker_exit()
+        except Exception as e:
+            print(f"Worker {os.getpid()} aturat per error: {e}", file=sys.stderr)
+            code = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)
+
+    def _stop(self, signum, frame):
+        self.stopping = True
+
+    def _reap(self):
+        """Recull els workers morts; retorna les hores de creació dels que han mort"""
+        died = []
+        for pid in list(self.children):
+            try:
+                done, _ = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                done = pid
+            if done:
+                died.append(self.children.pop(pid))
+        return died
+
+    def run(self):
+        self.sock = socket.create_server((self.host, self.port), backlog=self.backlog)
+        self.sock.set_inheritable(True)
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        print(f"Prefork: {self.workers} workers a {self.host}:{self.port} (pare {os.getpid()})")
+        for _ in range(self.workers):
+            self._spawn()
+
+        try:
+            while not self.stopping:
+                time.sleep(0.2)
+                for started in self._reap():
+                    if self.stopping:
+                        break
+                    if time.monotonic() - started < MIN_WORKER_LIFETIME:
+                        time.sleep(MIN_WORKER_LIFETIME)
+                    print("Prefork: un worker ha mort, se'n crea un de nou", file=sys.stderr)
+                    self._spawn()
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        """Demana als workers que acabin i els espera fins a graceful_timeout"""
+        for pid in self.children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + self.graceful_timeout
+        while self.children and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.1)
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+            self.children.pop(pid, None)
+        if self.sock is not None:
+            self.sock.close()
+        print("Prefork: tots els workers aturats")
@@ -0,0 +1,237 @@
+"""
+Previsualitzacions d'enllaços: títol, descripció i og:image de cada pàgina.
+Les metadades es descarreguen en segon pla amb un grup de fils i es desen a
+la taula link_previews; davant hi ha una cau LRU en memòria amb caducitat.
+Les peticions web només llegeixen la cau: mai esperen una descàrrega externa.
+"""
+
+import os
+import time
+import logging
+import threading
+from html.parser import HTMLParser
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional, Tuple
+from urllib.parse import urljoin, urlsplit
+import requests
+from flask import Blueprint, current_app, jsonify
+
+from cache import LRUCache
+from dbtools import get_pool, get_previews, get_link_url, store_preview
+from icons import check_host
+
+# Bytes llegits de cada pàgina: les metadades són al <head>
+MAX_HTML_BYTES = 256 * 1024
+MAX_TEXT = 300
+# Redireccions seguides a mà: cada salt es comprova amb check_host
+MAX_REDIRECTS = 5
+
+preview_bp = Blueprint('preview', __name__)
+
+class MetaParser(HTMLParser):
+    """Extreu <title>, description i les etiquetes Open Graph del <head>"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.meta = {}
+        self.title = ''
+        self._in_title = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'title':
+            self._in_title = True
+        elif tag == 'meta':
+            attrs = dict(attrs)
+            key = (attrs.get('property') or attrs.get('name') or '').lower()
+            if key and attrs.get('content') and key not in self.meta:
+                self.meta[key] = attrs['content']
+
+    def handle_endtag(self, tag):
+        if tag == 'title':
+            self._in_title = False
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title += data
+
+def _clean(text):
+    text = ' '.join((text or '').split())
+    return text[:MAX_TEXT] or None
+
+def parse_preview(html, base_url):
+    """
+    :return: (títol, descripció, imatge) de la pàgina
+    """
+    parser = MetaParser()
+    try:
+        parser.feed(html)
+    except Exception:
+        pass
+    meta = parser.meta
+    title = _clean(meta.get('og:title') or meta.get('twitter:title') or parser.title)
+    description = _clean(meta.get('og:description') or meta.get('description') or meta.get('twitter:description'))
+    image = meta.get('og:image') or meta.get('og:image:url') or meta.get('twitter:image')
+    if image:
+        image = urljoin(base_url, image.strip())
+        if urlsplit(image).scheme not in ('http', 'https'):
+            image = None
+    return title, description, image
+
+class PreviewService:
+    """
+    Cau de previsualitzacions en dos nivells: LRU en memòria (preview_memory_size
+    entrades) i la taula link_previews (preview_max_rows files). Una entrada
+    caduca als preview_ttl segons (preview_error_ttl si la pàgina no responia);
+    mentrestant es continua servint i es demana una nova descàrrega.
+    """
+
+    def __init__(self, config_module):
+        self.db_file = config_module.dbpath
+        self.enabled = getattr(config_module, 'link_previews', True)
+        self.ttl = getattr(config_module, 'preview_ttl', 7 * 86400)
+        self.error_ttl = getattr(config_module, 'preview_error_ttl', 3600)
+        self.max_rows = getattr(config_module, 'preview_max_rows', 10000)
+        self.timeout = getattr(config_module, 'preview_timeout', 5)
+        self.workers = getattr(config_module, 'preview_workers', 4)
+        self.allow_private = getattr(config_module, 'preview_allow_private', False)
+        self.memory = LRUCache(getattr(config_module, 'preview_memory_size', 1024))
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = 'slink3-preview'
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self.fetched = 0
+        self.failed = 0
+
+    def _submit(self, link_id, url):
+        with self._lock:
+            if link_id in self._pending:
+                return
+            # Els fils d'un procés pare no sobreviuen al fork: un executor per procés
+            if self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='preview')
+                self._pid = os.getpid()
+                self._pending.clear()
+            self._pending.add(link_id)
+            self._executor.submit(self._refresh, link_id, url)
+
+    def _expired(self, preview):
+        ttl = self.ttl if preview[2] == 200 else self.error_ttl
+        return time.time() - preview[6] > ttl
+
+    def get_many(self, conn, links: Iterable[Tuple]) -> Dict[int, Dict]:
+        """
+        Previsualitzacions en cau d'una llista d'enllaços; les que falten o
+        han caducat es demanen en segon pla
+        :param links: tuples d'enllaç (id, date, description, url, ...)
+        :return: id de l'enllaç -> {"title", "description", "image"}
+        """
+        if not self.enabled:
+            return {}
+        links = list(links)
+        found = {}
+        missing = []
+        for link in links:
+            preview = self.memory.get(link[0])
+            if preview is None or preview[1] != link[3]:
+                missing.append(link[0])
+            else:
+                found[link[0]] = preview
+        if missing:
+            for link_id, preview in get_previews(conn, missing).items():
+                found[link_id] = preview
+                self.memory.set(link_id, preview)
+
+        result = {}
+        for link in links:
+            preview = found.get(link[0])
+            # Sense previsualització, caducada o d'una URL que ha canviat: es torna a demanar
+            if preview is None or preview[1] != link[3] or self._expired(preview):
+                if link[3]:
+                    self._submit(link[0], link[3])
+            if preview is not None and preview[1] == link[3] and preview[2] == 200:
+                result[link[0]] = {"title": preview[3], "description": preview[4], "image": preview[5]}
+        return result
+
+    def fetch(self, url) -> Tuple[Optional[int], Optional[str], Optional[str], Optional[str]]:
+        """
+        Descarrega el principi de la pàgina i n'extreu les metadades
+        :return: (codi HTTP, títol, descripció, imatge); codi None si no hi ha connexió
+        """
+        for _ in range(MAX_REDIRECTS + 1):
+            # Ni adreces privades ni de loopback, tampoc després d'una redirecció
+            if not check_host(url, self.allow_private):
+                logging.info(f"No es previsualitza {url}: adreça no permesa")
+                return None, None, None, None
+            try:
+                with self.session.get(url, timeout=self.timeout, stream=True, allow_redirects=False) as response:
+                    if response.is_redirect:
+                        url = urljoin(url, response.headers['Location'])
+                        continue
+                    content_type = response.headers.get('Content-Type', '')
+                    if response.status_code != 200 or 'html' not in content_type:
+                        return response.status_code if response.status_code != 200 else 415, None, None, None
+                    data = b''
+                    for chunk in response.iter_content(16384):
+                        data += chunk
+                        if len(data) >= MAX_HTML_BYTES or b'</head>' in data.lower():
+                            break
+                    html = data.decode(response.encoding or 'utf-8', errors='replace')
+                    return 200, *parse_preview(html, url)
+            except requests.RequestException as e:
+                logging.info(f"No s'ha pogut previsualitzar {url}: {e}")
+                return None, None, None, None
+        logging.info(f"No s'ha pogut previsualitzar {url}: massa redireccions")
+        return None, None, None, None
+
+    def _refresh(self, link_id, url):
+        try:
+            status, title, description, image = self.fetch(url)
+            preview = (link_id, url, status, title, description, image, time.time())
+            with get_pool(self.db_file).connection() as conn:
+                if conn:
+                    store_preview(conn, preview, self.max_rows)
+            self.memory.set(link_id, preview)
+            if status == 200:
+                self.fetched += 1
+            else:
+                self.failed += 1
+        except Exception as e:
+            # Enllaç esborrat entretant, BD bloquejada...: es tornarà a provar
+            logging.error(f"Error desant la previsualització de {url}: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(link_id)
+
+    def is_pending(self, link_id):
+        with self._lock:
+            return link_id in self._pending
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._pending)
+        return {"enabled": self.enabled, "pending": pending, "fetched": self.fetched,
+                "failed": self.failed, "memory": self.memory.stats()}
+
+@preview_bp.route('/api/preview/<int:link_id>', methods=['GET'])
+def preview(link_id):
+    """
+    Previsualització en cau d'un enllaç. Si encara no n'hi ha, es demana en
+    segon pla i es respon 202: el client pot tornar-ho a provar més tard.
+    """
+    service = current_app.extensions.get('preview')
+    if service is None or not service.enabled:
+        return jsonify({"error": "Previsualitzacions desactivades"}), 404
+    with get_pool(service.db_file).connection() as conn:
+        if not conn:
+            return jsonify({"error": "No s'ha pogut connectar a la base de dades"}), 500
+        url = get_link_url(conn, link_id)
+        if url is None:
+            return jsonify({"error": "Enllaç no trobat"}), 404
+        previews = service.get_many(conn, [(link_id, None, None, url)])
+    if link_id not in previews:
+        if service.is_pending(link_id):
+            return jsonify({"id": link_id, "pending": True}), 202
+        return jsonify({"error": "La pàgina no té previsualització"}), 404
+    return jsonify({"id": link_id, **previews[link_id]})
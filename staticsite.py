@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Generador estàtic del linktree
+Renderitza els templates del tema a un directori d'HTML/JSON estàtic que es
+pot servir directament amb nginx, sense Python al camí de lectura.
+"""
+
+import os
+import sys
+import json
+import hashlib
+import logging
+import argparse
+import threading
+import importlib.util
+from contextlib import contextmanager
+from dbtools import get_pool, get_links, get_dead_links
+
+MANIFEST_NAME = '.build-manifest.json'
+LOCK_NAME = '.build.lock'
+DEFAULT_OUTPUT_DIR = 'public'
+DEFAULT_LINKS_LIMIT = 10
+# Forma en què es renderitzen les pàgines; canviar-la invalida les HTML del manifest
+RENDER_VERSION = 2
+
+_apps = {}
+_previews = {}
+_build_locks = {}
+_build_locks_lock = threading.Lock()
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+def load_config(config_file):
+    """
+    Carrega un mòdul de configuració dinàmicament des d'un fitxer
+    """
+    if not os.path.isfile(config_file):
+        raise FileNotFoundError(f"El fitxer de configuració '{config_file}' no existeix.")
+
+    spec = importlib.util.spec_from_file_location("config", config_file)
+    config_module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(config_module)
+
+    return config_module
+
+def _get_app(config_module):
+    """Retorna l'aplicació Flask del tema (creada una sola vegada)"""
+    key = (config_module.theme, config_module.dbpath)
+    if key not in _apps:
+        # Importació tardana: només cal si realment es renderitza alguna pàgina
+        from app import create_app
+        _apps[key] = create_app(config_module, None)
+    return _apps[key]
+
+def _get_previews(config_module):
+    """Cau de previsualitzacions de la BD (una sola per BD)"""
+    from preview_routes import PreviewService
+    if config_module.dbpath not in _previews:
+        _previews[config_module.dbpath] = PreviewService(config_module)
+    return _previews[config_module.dbpath]
+
+def templates_fingerprint(template_dir):
+    """
+    Empremta dels templates del tema (nom, mida i data de modificació).
+    Qualsevol canvi en un template (o en un de base) invalida les pàgines HTML.
+    """
+    digest = hashlib.sha256()
+    if os.path.isdir(template_dir):
+        for root, _, files in sorted(os.walk(template_dir)):
+            for name in sorted(files):
+                st = os.stat(os.path.join(root, name))
+                digest.update(f"{os.path.relpath(os.path.join(root, name), template_dir)}:{st.st_size}:{st.st_mtime_ns};".encode())
+    return digest.hexdigest()
+
+def _fingerprint(*parts):
+    return hashlib.sha256(json.dumps(parts, default=str).encode()).hexdigest()
+
+def _write_atomic(target, content):
+    """Escriu el fitxer de manera atòmica perquè nginx mai serveixi una pàgina a mitges"""
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    # Nom temporal propi de cada procés i fil: dues escriptures mai comparteixen fitxer
+    tmp = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(tmp, target)
+    except OSError:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+@contextmanager
+def _build_lock(output_dir):
+    """
+    Serialitza les generacions d'un directori: entre fils amb un Lock i, on
+    hi ha fcntl, entre processos (app.py, addlink, linkcheck) amb un flock
+    """
+    output_dir = os.path.abspath(output_dir)
+    with _build_locks_lock:
+        lock = _build_locks.setdefault(output_dir, threading.Lock())
+    with lock:
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(output_dir, exist_ok=True)
+        with open(os.path.join(output_dir, LOCK_NAME), 'w') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+def _load_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, MANIFEST_NAME), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _direct_href(link):
+    return link[3]
+
+def _pages(config_module, links, dead, previews, templates_fp):
+    """
+    Llista de pàgines a generar: (ruta de sortida, empremta d'entrada, funció de render)
+    """
+    def render(template, route, **context):
+        def _render():
+            from flask import render_template
+            app = _get_app(config_module)
+            with app.test_request_context(route):
+                # Nginx serveix aquestes pàgines sense Python: /go/<id> no hi existeix,
+                # així que els enllaços van directes sigui quin sigui track_clicks
+                return render_template(template, link_href=_direct_href, **context)
+        return _render
+
+    return [
+        ('index.html', _fingerprint(RENDER_VERSION, templates_fp), render('index.html', '/')),
+        ('view/index.html', _fingerprint(RENDER_VERSION, templates_fp, links, sorted(dead), sorted(previews.items())),
+         render('view.html', '/view', links=links, dead=dead, previews=previews)),
+        ('api/links.json', _fingerprint(links), lambda: json.dumps([link[:6] for link in links], default=str)),
+    ]
+
+def build(config_module, output_dir=None, force=False):
+    """
+    Genera el lloc estàtic. Només es renderitzen i s'escriuen les pàgines
+    l'empremta d'entrada de les quals ha canviat des de l'última generació.
+    :param config_module: Mòdul de configuració
+    :param output_dir: Directori de sortida (per defecte config.static_dir o 'public')
+    :param force: Regenera totes les pàgines encara que no hagin canviat
+    :return: Llista de pàgines escrites
+    """
+    output_dir = output_dir or getattr(config_module, 'static_dir', None) or DEFAULT_OUTPUT_DIR
+    limit = getattr(config_module, 'static_links_limit', DEFAULT_LINKS_LIMIT)
+
+    with _build_lock(output_dir):
+        return _build(config_module, output_dir, limit, force)
+
+def _build(config_module, output_dir, limit, force):
+    with get_pool(config_module.dbpath).connection() as conn:
+        if not conn:
+            raise Exception("No s'ha pogut establir connexió amb la base de dades")
+        dead_links = getattr(config_module, 'dead_links', 'flag')
+        links = get_links(conn, order='desc', limit=limit, hide_dead=dead_links == 'hide', type_names=True)
+        dead = get_dead_links(conn, [link[0] for link in links]) if dead_links == 'flag' else set()
+        previews = _get_previews(config_module).get_many(conn, links)
+
+    project_dir = os.path.dirname(os.path.abspath(__file__))
+    template_dir = os.path.join(project_dir, "templates", config_module.theme)
+    templates_fp = templates_fingerprint(template_dir)
+
+    manifest = {} if force else _load_manifest(output_dir)
+    written = []
+    for page, fp, render in _pages(config_module, links, dead, previews, templates_fp):
+        target = os.path.join(output_dir, page)
+        if manifest.get(page) == fp and os.path.isfile(target):
+            continue
+        try:
+            content = render()
+            _write_atomic(target, content)
+        except Exception as e:
+            # La pàgina queda fora del manifest i es tornarà a provar la propera vegada
+            logging.error(f"No s'ha pogut generar {page}: {e}")
+            continue
+        manifest[page] = fp
+        written.append(page)
+
+    if written:
+        _write_atomic(os.path.join(output_dir, MANIFEST_NAME), json.dumps(manifest, indent=2))
+    logging.info(f"Lloc estàtic generat a {output_dir}: {len(written)} pàgines actualitzades")
+    return written
+
+def rebuild_after_write(config_module):
+    """
+    Regenera les pàgines afectades després d'afegir un enllaç.
+    No fa res si la configuració no defineix static_dir.
+    Els errors es registren però no fan fallar l'escriptura.
+    """
+    if not getattr(config_module, 'static_dir', None):
+        return []
+    try:
+        return build(config_module)
+    except Exception as e:
+        logging.error(f"Error regenerant el lloc estàtic: {e}")
+        return []
+
+def main():
+    """
+    Funció principal
+    """
+    parser = argparse.ArgumentParser(description='Genera el lloc estàtic del linktree (build)')
+    parser.add_argument('-c', '--config', type=str, default='config.py',
+                       help='Fitxer de configuració (per defecte: config.py)')
+    parser.add_argument('-o', '--output', type=str, default=None,
+                       help='Directori de sortida (per defecte: static_dir de la configuració o public)')
+    parser.add_argument('-f', '--force', action='store_true',
+                       help='Regenera totes les pàgines')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    try:
+        config = load_config(args.config)
+        written = build(config, args.output, force=args.force)
+        print(f"Pàgines actualitzades: {', '.join(written) if written else 'cap'}")
+    except FileNotFoundError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
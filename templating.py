@@ -0,0 +1,140 @@
+"""
+Templates de l'aplicació: càrrega, cau de bytecode i escalfament.
+Els templates del tema tenen prioritat; si en falta algun s'usa la versió
+mínima d'aquest mòdul (també disponible com a fallback/<nom> per quan el
+del tema falla en renderitzar). La cau de bytecode a disc i la compilació a
+create_app fan que la primera petició d'un worker no hagi de compilar res.
+"""
+
+import os
+import logging
+from jinja2 import ChoiceLoader, DictLoader, FileSystemBytecodeCache, FileSystemLoader, PrefixLoader
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.jinja-cache')
+
+# Pàgines que es compilen en crear l'aplicació
+PAGES = ('index.html', 'addlink.html', 'addlink_iframe.html', 'view.html')
+
+FALLBACK_TEMPLATES = {
+    'index.html': """<!DOCTYPE html>
+<html>
+<head><title>SLink3 - Home</title></head>
+<body>
+    <h1>Benvingut a SLink3</h1>
+    <ul>
+        <li><a href="/addlink">Afegir Enllaç</a></li>
+        <li><a href="/view">Veure Enllaços</a></li>
+        <li><a href="/addlink_iframe">Afegir Enllaç (iframe)</a></li>
+        <li><a href="/service/status">Estat Serveis</a></li>
+    </ul>
+</body>
+</html>
+""",
+    'addlink.html': """<!DOCTYPE html>
+<html>
+<head><title>Afegir Enllaç</title></head>
+<body>
+    <h2>Afegir Nou Enllaç</h2>
+    <form method="post">
+        <p><label>Descripció:</label><br><input type="text" name="description" required></p>
+        <p><label>URL:</label><br><input type="url" name="url" required></p>
+        <p><label>Tipus:</label><br>
+           <select name="type_id">
+               <option value="">Selecciona un tipus</option>
+               {%- for type_row in types %}
+               <option value="{{ type_row[0] }}">{{ type_row[1] }}</option>
+               {%- endfor %}
+           </select>
+        </p>
+        <p><label>Icona:</label><br><input type="text" name="icon"></p>
+        <p><input type="submit" value="Afegir Enllaç"></p>
+    </form>
+    {%- if request.path != '/' %}
+    <a href="/">← Tornar</a>
+    {%- endif %}
+</body>
+</html>
+""",
+    'addlink_iframe.html': """<iframe src="{{ addlink_url }}" width="100%" height="600px"></iframe>
+<a href="/">← Tornar</a>
+""",
+    'view.html': """<!DOCTYPE html>
+<html>
+<head><title>Enllaços</title></head>
+<body>
+    <h2>Enllaços ({{ links|length }})</h2>
+    {%- for category, message in get_flashed_messages(with_categories=true) %}
+    <p class="{{ category }}">{{ message }}</p>
+    {%- endfor %}
+    <ul>
+    {%- for link in links %}
+        <li>
+            <strong>{{ link[2] }}</strong>{% if dead and link[0] in dead %} <em>(no respon)</em>{% endif %}<br>
+            <a href="{{ link_href(link) }}" target="_blank">{{ link[3] }}</a><br>
+            {%- set preview = previews.get(link[0]) if previews else None %}
+            {%- if preview and (preview.title or preview.description) %}
+            <em>{{ [preview.title, preview.description]|select|join(' — ') }}</em><br>
+            {%- endif %}
+            <small>Data: {{ link[1] }} | Tipus: {{ link[6] if link|length > 6 and link[6] else link[5] }} | Icona:
+            {%- if link[4] and link[4].startswith('/icons/') %} <img src="{{ link[4] }}" width="16" height="16" alt="">
+            {%- else %} {{ link[4] }}{% endif %}</small>
+        </li>
+    {%- endfor %}
+    </ul>
+    {%- if next_url %}
+    <a href="{{ next_url }}">Següents →</a><br>
+    {%- endif %}
+    <a href="/">← Tornar</a>
+</body>
+</html>
+""",
+}
+
+def make_loader(template_dir):
+    """
+    Templates del tema i, per als que hi falten, els de FALLBACK_TEMPLATES
+    """
+    fallback = DictLoader(FALLBACK_TEMPLATES)
+    loaders = [PrefixLoader({'fallback': fallback}), fallback]
+    if template_dir and os.path.isdir(template_dir):
+        loaders.insert(0, FileSystemLoader(template_dir))
+    return ChoiceLoader(loaders)
+
+def bytecode_cache(config_module):
+    """
+    Cau de bytecode compartida per tots els processos (template_cache_dir;
+    None o False la desactiva)
+    """
+    directory = getattr(config_module, 'template_cache_dir', DEFAULT_CACHE_DIR)
+    if not directory:
+        return None
+    try:
+        os.makedirs(directory, exist_ok=True)
+    except OSError as e:
+        logging.warning(f"No es pot crear la cau de templates {directory}: {e}")
+        return None
+    return FileSystemBytecodeCache(directory)
+
+def configure(app, config_module, template_dir):
+    """
+    Assigna el carregador i la cau de bytecode. S'ha de cridar abans del
+    primer accés a app.jinja_env.
+    """
+    app.jinja_loader = make_loader(template_dir)
+    app.jinja_options = {**app.jinja_options, 'bytecode_cache': bytecode_cache(config_module)}
+
+def warm_up(app, pages=PAGES):
+    """
+    Compila les pàgines (del tema i de fallback) perquè la primera petició
+    ja les trobi a la cau de l'entorn
+    :return: nombre de templates compilats
+    """
+    compiled = 0
+    for name in pages:
+        for template in (name, f"fallback/{name}"):
+            try:
+                app.jinja_env.get_template(template)
+                compiled += 1
+            except Exception as e:
+                logging.warning(f"No s'ha pogut compilar el template {template}: {e}")
+    return compiled
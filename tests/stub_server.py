@@ -0,0 +1,59 @@
+"""
+Local stand-in for the third-party hosts that icons.py and linkcheck.py talk to
+"""
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Tuple
+
+# route handler: (method, headers) -> (status, response headers, body)
+Route = Callable[[str, Dict[str, str]], Tuple[int, Dict[str, str], bytes]]
+
+class StubServer:
+    """
+    HTTP server on 127.0.0.1 with a free port, answering from a routes dict
+    and recording every request as (method, path, headers)
+    """
+
+    def __init__(self, routes: Dict[str, Route]):
+        self.routes = routes
+        self.requests: List[Tuple[str, str, Dict[str, str]]] = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _answer(self):
+                headers = dict(self.headers.items())
+                stub.requests.append((self.command, self.path, headers))
+                route = stub.routes.get(self.path)
+                status, extra, body = route(self.command, headers) if route else (404, {}, b'')
+                self.send_response(status)
+                for name, value in extra.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if self.command != 'HEAD':
+                    self.wfile.write(body)
+
+            do_GET = _answer
+            do_HEAD = _answer
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def url(self, path: str) -> str:
+        return f"http://127.0.0.1:{self.server.server_port}{path}"
+
+    def hits(self, path: str) -> List[str]:
+        """Methods of the requests made to one path"""
+        return [method for method, request_path, _ in self.requests if request_path == path]
+
+    def __enter__(self) -> 'StubServer':
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.server.shutdown()
+        self.server.server_close()
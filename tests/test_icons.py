@@ -0,0 +1,76 @@
+import os
+import shutil
+import tempfile
+import types
+import unittest
+from datetime import datetime
+
+from dbtools import add_link, get_pool
+from icons import ICON_PREFIX, IconStore, check_host, localize_links
+from tests.stub_server import StubServer
+
+SVG = b'<svg xmlns="http://www.w3.org/2000/svg" width="16" height="16"><rect width="16" height="16"/></svg>'
+
+def svg(method, headers):
+    return 200, {'Content-Type': 'image/svg+xml'}, SVG
+
+def moved(method, headers):
+    return 302, {'Location': '/icon.svg'}, b''
+
+def not_an_image(method, headers):
+    return 200, {'Content-Type': 'text/html'}, b'<html></html>'
+
+class IconTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.server = StubServer({'/icon.svg': svg, '/favicon.ico': svg, '/moved': moved,
+                                  '/page.html': not_an_image}).__enter__()
+        self.config = types.SimpleNamespace(
+            dbpath=os.path.join(self.dir, 'links.db'), theme='default', template_cache_dir=None,
+            icon_dir=os.path.join(self.dir, 'icons'), icon_allow_private=True, link_previews=False)
+
+    def tearDown(self):
+        self.server.__exit__(None, None, None)
+        shutil.rmtree(self.dir)
+
+    def test_fetch_stores_content_addressed(self):
+        store = IconStore(self.config.icon_dir, allow_private=True)
+        icon_hash = store.fetch(self.server.url('/icon.svg'))
+        self.assertIsNotNone(icon_hash)
+        with open(store.path(icon_hash), 'rb') as f:
+            self.assertEqual(f.read(), SVG)
+        # Same content, same file: following the redirect stores nothing new
+        self.assertEqual(store.fetch(self.server.url('/moved')), icon_hash)
+        self.assertIsNone(store.fetch(self.server.url('/page.html')))
+
+    def test_private_address_refused(self):
+        store = IconStore(self.config.icon_dir)
+        self.assertIsNone(store.fetch(self.server.url('/icon.svg')))
+        self.assertEqual(self.server.requests, [])
+        self.assertFalse(check_host(self.server.url('/icon.svg')))
+        self.assertFalse(check_host('file:///etc/passwd', allow_private=True))
+        self.assertTrue(check_host(self.server.url('/icon.svg'), allow_private=True))
+
+    def test_localize_and_serve(self):
+        with get_pool(self.config.dbpath).connection() as conn:
+            link_id = add_link(conn, (datetime.now(), 'stub', self.server.url('/'), None, None))
+        self.assertEqual(localize_links(self.config, [(link_id, None, self.server.url('/'))]), 1)
+        self.assertEqual(self.server.hits('/favicon.ico'), ['GET'])
+        with get_pool(self.config.dbpath).connection() as conn:
+            icon = conn.execute("SELECT icon FROM links WHERE id = ?", (link_id,)).fetchone()[0]
+        self.assertTrue(icon.startswith(ICON_PREFIX))
+
+        from app import create_app
+        client = create_app(self.config, None).test_client()
+        response = client.get(icon)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, SVG)
+        self.assertEqual(response.mimetype, 'image/svg+xml')
+        self.assertIn('immutable', response.headers['Cache-Control'])
+        revalidated = client.get(icon, headers={'If-None-Match': response.headers['ETag']})
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(client.get(ICON_PREFIX + '0' * 32).status_code, 404)
+
+if __name__ == '__main__':
+    unittest.main()
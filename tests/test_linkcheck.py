@@ -0,0 +1,85 @@
+import os
+import shutil
+import tempfile
+import types
+import unittest
+from datetime import datetime
+
+from dbtools import add_link, get_dead_links, get_pool
+from linkcheck import LinkChecker, check_links
+from tests.stub_server import StubServer
+
+def no_head(method, headers):
+    return (405, {}, b'') if method == 'HEAD' else (200, {'Content-Type': 'text/html'}, b'ok')
+
+def etag(method, headers):
+    if headers.get('If-None-Match') == '"v1"':
+        return 304, {}, b''
+    return 200, {'ETag': '"v1"'}, b'ok'
+
+def gone(method, headers):
+    return 404, {}, b''
+
+class LinkCheckTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.server = StubServer({'/no-head': no_head, '/etag': etag, '/gone': gone}).__enter__()
+        self.config = types.SimpleNamespace(
+            dbpath=os.path.join(self.dir, 'links.db'), linkcheck_per_host_rate=0,
+            linkcheck_workers=2, linkcheck_dead_after=2)
+        self.ids = {}
+        with get_pool(self.config.dbpath).connection() as conn:
+            for path in ('/no-head', '/etag', '/gone'):
+                self.ids[path] = add_link(conn, (datetime.now(), path, self.server.url(path), None, ''))
+
+    def tearDown(self):
+        self.server.__exit__(None, None, None)
+        shutil.rmtree(self.dir)
+
+    def status(self, path):
+        with get_pool(self.config.dbpath).connection() as conn:
+            return conn.execute("SELECT status, etag, failures, dead FROM link_status WHERE link_id = ?",
+                                (self.ids[path],)).fetchone()
+
+    def test_head_falls_back_to_get(self):
+        status, error, _, _ = LinkChecker(per_host_rate=0).probe(self.server.url('/no-head'))
+        self.assertEqual((status, error), (200, None))
+        self.assertEqual(self.server.hits('/no-head'), ['HEAD', 'GET'])
+
+    def test_revalidation_and_dead_links(self):
+        self.assertEqual(check_links(self.config)['checked'], 3)
+        self.assertEqual(self.status('/etag'), (200, '"v1"', 0, 0))
+        self.assertEqual(self.status('/gone'), (404, None, 1, 0))
+
+        result = check_links(self.config)
+        self.assertEqual(result['dead'], 1)
+        # The stored ETag is sent back and a 304 keeps it
+        self.assertEqual(self.server.hits('/etag'), ['HEAD', 'HEAD'])
+        etag_requests = [headers for method, path, headers in self.server.requests if path == '/etag']
+        self.assertEqual(etag_requests[-1].get('If-None-Match'), '"v1"')
+        self.assertEqual(self.status('/etag'), (304, '"v1"', 0, 0))
+        # dead_after failures in a row mark the link dead
+        self.assertEqual(self.status('/gone'), (404, None, 2, 1))
+        self.assertEqual(self.status('/no-head'), (200, None, 0, 0))
+        with get_pool(self.config.dbpath).connection() as conn:
+            self.assertEqual(get_dead_links(conn), {self.ids['/gone']})
+
+    def test_malformed_url_does_not_stop_the_run(self):
+        with get_pool(self.config.dbpath).connection() as conn:
+            # Stored before URLs were normalized on insert
+            cur = conn.execute("INSERT INTO links(date, description, url) VALUES(?, ?, ?)",
+                               (datetime.now(), 'broken', 'http://[::1'))
+            conn.commit()
+            broken_id = cur.lastrowid
+        self.assertEqual(check_links(self.config)['checked'], 4)
+        with get_pool(self.config.dbpath).connection() as conn:
+            status, error, failures = conn.execute("SELECT status, error, failures FROM link_status WHERE link_id = ?",
+                                                   (broken_id,)).fetchone()
+        self.assertIsNone(status)
+        self.assertTrue(error.startswith('Invalid URL'))
+        self.assertEqual(failures, 1)
+        self.assertEqual(self.status('/etag'), (200, '"v1"', 0, 0))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,261 @@
+"""
+Transports per parlar amb el servei addlink
+- tcp: HTTP sobre TCP amb keep-alive (procés separat)
+- unix: HTTP sobre un socket Unix (procés separat, sense pila TCP)
+- inprocess: crida directament les funcions d'addlink, sense segon procés
+"""
+
+import json
+import socket
+import threading
+import http.client
+import requests
+import urllib3
+from urllib.parse import urlsplit, parse_qsl
+
+class TransportError(Exception):
+    """El servei no és accessible pel transport (error de xarxa o de socket)"""
+
+class TcpTransport:
+    """
+    HTTP sobre TCP amb una requests.Session compartida (keep-alive)
+    """
+    name = 'tcp'
+
+    def __init__(self, host, port, pool_size=10, connect_timeout=2, read_timeout=10):
+        self.base_url = f"http://{host}:{port}"
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.pool_size = pool_size
+        self.session = requests.Session()
+        self._adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', self._adapter)
+        self._requests = 0
+        self._opened = 0
+        self._reused = 0
+
+        # urllib3 reobre el socket sobre el mateix objecte de connexió quan el
+        # servidor el tanca, així que es compten les connexions TCP reals; una
+        # petició enviada per un socket que ja estava obert és una reutilització
+        transport = self
+
+        class CountingConnection(urllib3.connection.HTTPConnection):
+            def connect(self):
+                super().connect()
+                transport._opened += 1
+
+            def request(self, *args, **kwargs):
+                if self.sock is not None:
+                    transport._reused += 1
+                return super().request(*args, **kwargs)
+
+        class CountingPool(urllib3.HTTPConnectionPool):
+            ConnectionCls = CountingConnection
+
+        self._adapter.poolmanager.pool_classes_by_scheme = {'http': CountingPool}
+
+    def server_args(self, host, port):
+        """Arguments de línia de comandes perquè addlink.py escolti en aquest transport"""
+        return ['--host', host, '--port', str(port)]
+
+    def request(self, method, path, json=None, read_timeout=None):
+        """
+        Fa una petició al servei
+        :return: (codi d'estat, cos JSON o text)
+        """
+        self._requests += 1
+        timeout = (self.connect_timeout, read_timeout or self.read_timeout)
+        try:
+            response = self.session.request(method, f"{self.base_url}{path}", json=json, timeout=timeout)
+        except requests.RequestException as e:
+            raise TransportError(str(e)) from e
+        try:
+            return response.status_code, response.json()
+        except ValueError:
+            return response.status_code, response.text
+
+    def stats(self):
+        """Estadístiques de reutilització de connexions"""
+        return {
+            "transport": self.name,
+            "requests": self._requests,
+            "connections_opened": self._opened,
+            "connections_reused": self._reused,
+            "pool_maxsize": self.pool_size
+        }
+
+    def close(self):
+        self.session.close()
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTPConnection que es connecta a un socket Unix"""
+
+    def __init__(self, socket_path, timeout):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        self.sock = sock
+
+class UnixSocketTransport:
+    """
+    HTTP sobre un socket Unix, amb una connexió keep-alive per fil
+    """
+    name = 'unix'
+
+    def __init__(self, socket_path, connect_timeout=2, read_timeout=10):
+        self.socket_path = socket_path
+        self.base_url = None
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+        self._requests = 0
+        self._opened = 0
+        self._reused = 0
+
+    def server_args(self, host, port):
+        return ['--host', f"unix://{self.socket_path}", '--port', '0']
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = _UnixHTTPConnection(self.socket_path, self.connect_timeout)
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def _discard(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+            with self._lock:
+                if conn in self._connections:
+                    self._connections.remove(conn)
+
+    def request(self, method, path, json=None, read_timeout=None):
+        """
+        Fa una petició al servei
+        :return: (codi d'estat, cos JSON o text)
+        """
+        self._requests += 1
+        body = None if json is None else _dumps(json)
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+
+        # Una connexió reutilitzada pot haver estat tancada pel servidor mentre
+        # estava inactiva: en aquest cas (i només en aquest) es reintenta un cop
+        for attempt in range(2):
+            conn = self._connection()
+            reused = conn.sock is not None
+            try:
+                if conn.sock is None:
+                    conn.connect()
+                    self._opened += 1
+                conn.sock.settimeout(read_timeout or self.read_timeout)
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                data = response.read()
+                if reused:
+                    self._reused += 1
+                break
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError) as e:
+                self._discard()
+                if not reused or attempt:
+                    raise TransportError(str(e)) from e
+            except (OSError, http.client.HTTPException) as e:
+                self._discard()
+                raise TransportError(str(e)) from e
+
+        if response.will_close:
+            self._discard()
+        try:
+            return response.status, _loads(data)
+        except ValueError:
+            return response.status, data.decode('utf-8', errors='replace')
+
+    def stats(self):
+        return {
+            "transport": self.name,
+            "requests": self._requests,
+            "connections_opened": self._opened,
+            "connections_reused": self._reused,
+            "socket": self.socket_path
+        }
+
+    def close(self):
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+
+class InProcessTransport:
+    """
+    Crida directament les funcions d'addlink dins del mateix procés:
+    ni segon procés ni salt de xarxa
+    """
+    name = 'inprocess'
+
+    def __init__(self, config_module):
+        # Importació tardana: addlink només cal en aquest mode
+        import addlink
+        self._addlink = addlink
+        self.config_module = config_module
+        self.base_url = None
+        self._requests = 0
+        self._routes = {
+            ('GET', '/health'): lambda data, args: addlink.health(config_module),
+            ('POST', '/api/addlink'): lambda data, args: addlink.api_add_link(config_module, data),
+            ('POST', '/api/addlinks'): lambda data, args: addlink.api_add_links(config_module, data,
+                                                                                 args.get('on_conflict')),
+        }
+
+    def server_args(self, host, port):
+        return None
+
+    def request(self, method, path, json=None, read_timeout=None):
+        self._requests += 1
+        parts = urlsplit(path)
+        handler = self._routes.get((method, parts.path))
+        if handler is None:
+            return 404, {"error": "Ruta no trobada"}
+        try:
+            body, status = handler(json, dict(parse_qsl(parts.query)))
+        except Exception as e:
+            return 500, {"error": "Error processant la sol·licitud", "details": str(e)}
+        return status, body
+
+    def stats(self):
+        return {"transport": self.name, "requests": self._requests}
+
+    def close(self):
+        pass
+
+def _dumps(data):
+    return json.dumps(data).encode('utf-8')
+
+def _loads(data):
+    return json.loads(data.decode('utf-8'))
+
+def create_transport(kind, config_module=None, host='127.0.0.1', port=5001, socket_path='addlink.sock',
+                     pool_size=10, connect_timeout=2, read_timeout=10):
+    """
+    Crea el transport indicat a la configuració (addlink_transport)
+    :param kind: 'tcp', 'unix' o 'inprocess'
+    """
+    if kind == 'tcp':
+        return TcpTransport(host, port, pool_size, connect_timeout, read_timeout)
+    if kind == 'unix':
+        return UnixSocketTransport(socket_path, connect_timeout, read_timeout)
+    if kind == 'inprocess':
+        return InProcessTransport(config_module)
+    raise ValueError(f"Transport addlink desconegut: {kind}")